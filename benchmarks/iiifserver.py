@@ -0,0 +1,352 @@
+"""
+A local stand-in for IIIF servers, used by the benchmarks. It serves
+synthetic Presentation API 3 manifests (many canvases, multi-band Choices,
+thousands of annotations, referenced and paginated annotation pages) and
+collections, and generates the images of a Image API 3 level 1 service with
+tiles. Every response can be delayed for simulating the network latency.
+
+Run it alone with: python benchmarks/iiifserver.py --port 8000
+"""
+import argparse
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import re
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+
+class Config:
+    def __init__(
+        self,
+        canvases=100,
+        width=4000,
+        height=3000,
+        bands=4,
+        choice_every=10,
+        annotations=1000,
+        external_pages=3,
+        collection_size=10000,
+        latency=0.0,
+        image_pages=False,
+    ):
+        """The shape of the synthetic resources.
+
+        Args:
+            canvases (int, optional): Canvases of the manifest. Defaults to
+            100.
+            width (int, optional): Width of the images. Defaults to 4000.
+            height (int, optional): Height of the images. Defaults to 3000.
+            bands (int, optional): Layers of the Choice canvases. Defaults
+            to 4.
+            choice_every (int, optional): One canvas every choice_every is a
+            multi-band Choice. Defaults to 10.
+            annotations (int, optional): Annotations embedded in every
+            canvas. Defaults to 1000.
+            external_pages (int, optional): Referenced annotation pages,
+            linked by next, of every canvas. Defaults to 3.
+            collection_size (int, optional): Manifests listed in the
+            collection. Defaults to 10000.
+            latency (float, optional): Seconds every response is delayed.
+            Defaults to 0.
+            image_pages (bool, optional): The images (not Choices) also
+            reference the annotation pages of their canvas. Defaults to
+            False.
+        """
+        self.canvases = canvases
+        self.width = width
+        self.height = height
+        self.bands = bands
+        self.choice_every = choice_every
+        self.annotations = annotations
+        self.external_pages = external_pages
+        self.collection_size = collection_size
+        self.latency = latency
+        self.image_pages = image_pages
+
+
+def _text(value, language="en"):
+    return {language: [value]}
+
+
+def _image(base, ident, config, label=None):
+    image = {
+        "id": f"{base}/img/{ident}/full/max/0/default.jpg",
+        "type": "Image",
+        "format": "image/jpeg",
+        "width": config.width,
+        "height": config.height,
+        "service": [{"id": f"{base}/img/{ident}", "type": "ImageService3"}],
+    }
+    if label is not None:
+        image["label"] = _text(label)
+    return image
+
+
+def manifest(base, config):
+    items = []
+    for i in range(config.canvases):
+        canvas = f"{base}/canvas/{i}"
+        if config.choice_every and i % config.choice_every == 1:
+            body = {
+                "type": "Choice",
+                "items": [
+                    _image(base, f"c{i}b{k}", config, f"band {k}")
+                    for k in range(config.bands)
+                ],
+            }
+        else:
+            body = _image(base, f"c{i}", config)
+            if config.image_pages and config.external_pages:
+                body["annotations"] = [
+                    {"id": f"{base}/external/{i}/0", "type": "AnnotationPage"}
+                ]
+        annotations = [
+            {
+                "id": f"{base}/anno/{i}/{k}",
+                "type": "Annotation",
+                "motivation": "commenting",
+                "body": {"type": "TextualBody", "value": f"note {k}"},
+                "target": f"{canvas}#xywh={k * 37 % config.width},"
+                f"{k * 53 % config.height},40,30",
+            }
+            for k in range(config.annotations)
+        ]
+        pages = [
+            {
+                "id": f"{base}/annopage/{i}",
+                "type": "AnnotationPage",
+                "items": annotations,
+            }
+        ]
+        if config.external_pages:
+            pages.append({"id": f"{base}/external/{i}/0", "type": "AnnotationPage"})
+        items.append(
+            {
+                "id": canvas,
+                "type": "Canvas",
+                "label": _text(f"page {i}"),
+                "width": config.width,
+                "height": config.height,
+                "items": [
+                    {
+                        "id": f"{base}/page/{i}",
+                        "type": "AnnotationPage",
+                        "items": [
+                            {
+                                "id": f"{base}/paint/{i}",
+                                "type": "Annotation",
+                                "motivation": "painting",
+                                "body": body,
+                                "target": canvas,
+                            }
+                        ],
+                    }
+                ],
+                "annotations": pages,
+            }
+        )
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": f"{base}/manifest.json",
+        "type": "Manifest",
+        "label": _text("Synthetic manifest"),
+        "items": items,
+        "requiredStatement": {"label": _text("Attribution"), "value": _text("Test")},
+    }
+
+
+def external_page(base, config, canvas, number):
+    page = {
+        "id": f"{base}/external/{canvas}/{number}",
+        "type": "AnnotationPage",
+        "items": [
+            {
+                "id": f"{base}/ext/{canvas}/{number}/{k}",
+                "type": "Annotation",
+                "motivation": "supplementing",
+                "body": {"type": "TextualBody", "value": f"line {number}-{k}"},
+                "target": f"{base}/canvas/{canvas}#xywh={k * 10},{number * 40},200,30",
+            }
+            for k in range(100)
+        ],
+    }
+    if number + 1 < config.external_pages:
+        page["next"] = f"{base}/external/{canvas}/{number + 1}"
+    return page
+
+
+def collection(base, config):
+    return {
+        "@context": "http://iiif.io/api/presentation/3/context.json",
+        "id": f"{base}/collection.json",
+        "type": "Collection",
+        "label": _text("Synthetic collection"),
+        "items": [
+            {
+                "id": f"{base}/manifest.json?copy={k}",
+                "type": "Manifest",
+                "label": _text(f"manuscript {k}"),
+            }
+            for k in range(config.collection_size)
+        ],
+    }
+
+
+def info(base, ident, config):
+    return {
+        "@context": "http://iiif.io/api/image/3/context.json",
+        "id": f"{base}/img/{ident}",
+        "type": "ImageService3",
+        "protocol": "http://iiif.io/api/image",
+        "profile": "level1",
+        "width": config.width,
+        "height": config.height,
+        "sizes": [
+            {"width": config.width // f, "height": config.height // f}
+            for f in (16, 8, 4)
+        ],
+        "tiles": [{"width": 512, "scaleFactors": [1, 2, 4, 8, 16]}],
+    }
+
+
+def _region(region, width, height):
+    if region == "full":
+        return 0, 0, width, height
+    if region == "square":
+        side = min(width, height)
+        return (width - side) // 2, (height - side) // 2, side, side
+    if region.startswith("pct:"):
+        px, py, pw, ph = map(float, region[4:].split(","))
+        return (
+            int(px * width / 100),
+            int(py * height / 100),
+            int(pw * width / 100),
+            int(ph * height / 100),
+        )
+    x, y, w, h = (int(float(v)) for v in region.split(","))
+    return x, y, min(w, width - x), min(h, height - y)
+
+
+def _size(size, w, h):
+    size = size.lstrip("^")
+    if size in ("max", "full"):
+        return w, h
+    if size.startswith("pct:"):
+        p = float(size[4:]) / 100
+        return max(1, round(w * p)), max(1, round(h * p))
+    fit = size.startswith("!")
+    a, b = size.lstrip("!").split(",")
+    if a and b:
+        if not fit:
+            return int(a), int(b)
+        scale = min(int(a) / w, int(b) / h)
+        return max(1, round(w * scale)), max(1, round(h * scale))
+    if a:
+        return int(a), max(1, round(h * int(a) / w))
+    return max(1, round(w * int(b) / h)), int(b)
+
+
+@lru_cache(maxsize=512)
+def render(region, size, fmt, width, height):
+    """Encode a gradient with a checkerboard, the same for every image."""
+    x, y, w, h = _region(region, width, height)
+    ow, oh = _size(size, w, h)
+    xs = np.linspace(x, x + w, ow, endpoint=False)
+    ys = np.linspace(y, y + h, oh, endpoint=False)
+    r = (xs[None, :] / width * 255).astype(np.uint8).repeat(oh, 0)
+    g = (ys[:, None] / height * 255).astype(np.uint8).repeat(ow, 1)
+    b = (((xs[None, :] // 100 + ys[:, None] // 100) % 2) * 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(np.dstack([r, g, b])).save(
+        buf, format="PNG" if fmt == "png" else "JPEG"
+    )
+    return buf.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    config = Config()
+    stats = {"requests": 0, "bytes": 0}
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, data, ctype):
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "max-age=3600")
+        self.end_headers()
+        self.wfile.write(data)
+        self.stats["bytes"] += len(data)
+
+    def send_json(self, document):
+        self.send(json.dumps(document).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        self.stats["requests"] += 1
+        config = self.config
+        time.sleep(config.latency)
+        base = f"http://{self.headers['Host']}"
+        path = self.path.split("?")[0]
+        if path == "/manifest.json":
+            return self.send_json(manifest(base, config))
+        if path == "/collection.json":
+            return self.send_json(collection(base, config))
+        m = re.match(r"/external/(\d+)/(\d+)$", path)
+        if m:
+            return self.send_json(
+                external_page(base, config, int(m.group(1)), int(m.group(2)))
+            )
+        m = re.match(r"/img/([^/]+)/info.json$", path)
+        if m:
+            return self.send_json(info(base, m.group(1), config))
+        m = re.match(r"/img/[^/]+/([^/]+)/([^/]+)/[^/]+/\w+\.(\w+)$", path)
+        if m:
+            data = render(
+                m.group(1), m.group(2), m.group(3), config.width, config.height
+            )
+            return self.send(data, f"image/{'png' if m.group(3) == 'png' else 'jpeg'}")
+        self.send_response(404)
+        self.end_headers()
+
+
+def serve(port=0, **kwargs):
+    """Start the server in a background thread.
+
+    Args:
+        port (int, optional): Defaults to a free port.
+        **kwargs: Passed to Config.
+
+    Returns:
+        tuple: The server (stop it with shutdown()) and its base URL.
+    """
+    Handler.config = Config(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local IIIF stand-in server.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--canvases", type=int, default=100)
+    parser.add_argument("--annotations", type=int, default=1000)
+    args = parser.parse_args()
+    server, base = serve(
+        args.port,
+        latency=args.latency,
+        canvases=args.canvases,
+        annotations=args.annotations,
+    )
+    print(f"Manifest: {base}/manifest.json\nCollection: {base}/collection.json")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
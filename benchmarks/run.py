@@ -0,0 +1,236 @@
+"""
+Benchmarks of the hot paths of the viewer against the local IIIF stand-in
+server: opening a manifest, switching canvas, stacking the bands of a
+Choice, loading the zoom and browsing a large collection. Every benchmark
+reports its timings and its peak of Python memory, and the results can be
+saved as a baseline and compared with it later:
+
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --baseline baseline.json
+
+The exit status is 1 if a metric is worse than the baseline by more than the
+tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import iiifserver  # noqa: E402
+from iiifnotebook import IIIFcore, IIIFviewer  # noqa: E402
+from iiifnotebook.collection import Collection  # noqa: E402
+
+BENCHMARKS = []
+# metrics where a higher value is better, all the others are times or sizes
+HIGHER_IS_BETTER = {"stack_choices.mb_per_s"}
+# settings that change the work done, runs are comparable only if equal
+WORKLOAD = ("latency", "canvases", "annotations", "switches", "stack_size")
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def _viewer(base, **kwargs):
+    return IIIFviewer(base + "/manifest.json", **kwargs)
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+@benchmark
+def open_manifest(base, args):
+    t = time.perf_counter()
+    core = IIIFcore(base + "/manifest.json")
+    core_time = time.perf_counter() - t
+    core.close()
+    t = time.perf_counter()
+    viewer = _viewer(base)
+    viewer_time = time.perf_counter() - t
+    viewer.close()
+    return {"open_manifest.core_s": core_time, "open_manifest.viewer_s": viewer_time}
+
+
+@benchmark
+def canvas_switch(base, args):
+    viewer = _viewer(base)
+    times = []
+    for canvas in range(1, args.switches + 1):
+        t = time.perf_counter()
+        viewer.W_canvasID.value = canvas
+        times.append(time.perf_counter() - t)
+    viewer.close()
+    return {
+        "canvas_switch.median_ms": statistics.median(times) * 1000,
+        "canvas_switch.p95_ms": _percentile(times, 0.95) * 1000,
+    }
+
+
+@benchmark
+def stack_choices(base, args):
+    viewer = _viewer(base)
+    viewer.W_final_size.value = args.stack_size
+    t = time.perf_counter()
+    stack = viewer.get_stackfromChoices(1)
+    elapsed = time.perf_counter() - t
+    viewer.close()
+    return {
+        "stack_choices.s": elapsed,
+        "stack_choices.mb_per_s": stack.nbytes / 2**20 / elapsed,
+    }
+
+
+@benchmark
+def zoom_load(base, args):
+    results = {}
+    for deepzoom in (False, True):
+        viewer = _viewer(base)
+        viewer.W_deepzoom.value = deepzoom
+        x1, x2 = viewer.ax.get_xlim()
+        y1, y2 = viewer.ax.get_ylim()
+        # a region of 1/8 of the sides in the middle of the canvas
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        dx, dy = (x2 - x1) / 16, (y1 - y2) / 16
+        viewer.ax.set_xlim(cx - dx, cx + dx)
+        viewer.ax.set_ylim(cy + dy, cy - dy)
+        t = time.perf_counter()
+        viewer.W_loadZoombtn.click()
+        name = "tiles" if deepzoom else "region"
+        results[f"zoom_load.{name}_s"] = time.perf_counter() - t
+        viewer.close()
+    return results
+
+
+@benchmark
+def browse_collection(base, args):
+    t = time.perf_counter()
+    collection = Collection.from_url(base + "/collection.json")
+    opened = time.perf_counter() - t
+    t = time.perf_counter()
+    for number in range(collection.pages()):
+        collection.page(number)
+    paged = time.perf_counter() - t
+    t = time.perf_counter()
+    found = list(collection.search("manuscript 99"))
+    searched = time.perf_counter() - t
+    assert found
+    return {
+        "browse_collection.open_s": opened,
+        "browse_collection.page_all_s": paged,
+        "browse_collection.search_s": searched,
+    }
+
+
+def run(base, args):
+    """Run the benchmarks selected, returning {metric: value}."""
+    selected = [b for b in BENCHMARKS if not args.only or b.__name__ in args.only]
+    metrics = {}
+    for func in selected:
+        runs = []
+        for _ in range(args.repeat):
+            runs.append(func(base, args))
+            plt.close("all")
+            gc.collect()
+        for name in runs[0]:
+            metrics[name] = statistics.median(r[name] for r in runs)
+        # the peak is measured apart, tracing slows down the allocations
+        tracemalloc.start()
+        func(base, args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        plt.close("all")
+        gc.collect()
+        metrics[f"{func.__name__}.peak_mb"] = peak / 2**20
+        print(f"{func.__name__} done", file=sys.stderr)
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """Print the metrics with the change from the baseline.
+
+    Returns:
+        list: The names of the metrics that regressed.
+    """
+    regressions = []
+    print(f"{'metric':34} {'value':>10} {'baseline':>10} {'change':>8}")
+    for name, value in metrics.items():
+        line = f"{name:34} {value:10.3f}"
+        if name in baseline:
+            reference = baseline[name]
+            change = (value - reference) / reference if reference else 0.0
+            worse = -change if name in HIGHER_IS_BETTER else change
+            line += f" {reference:10.3f} {change:+8.1%}"
+            if worse > tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of pyIIIFnotebook.")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--canvases", type=int, default=100)
+    parser.add_argument("--annotations", type=int, default=1000)
+    parser.add_argument("--switches", type=int, default=10)
+    parser.add_argument("--stack-size", default="1000,")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="Names of the benchmarks.")
+    parser.add_argument("--baseline", help="JSON file of a previous run.")
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative worsening reported as regression. Defaults to 0.2.",
+    )
+    args = parser.parse_args()
+    server, base = iiifserver.serve(
+        latency=args.latency, canvases=args.canvases, annotations=args.annotations
+    )
+    try:
+        metrics = run(base, args)
+    finally:
+        server.shutdown()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        baseline = stored["metrics"]
+        for key in WORKLOAD:
+            if stored["settings"].get(key) != getattr(args, key):
+                print(f"The baseline was run with a different {key}.")
+    regressions = compare(metrics, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "metrics": metrics,
+                    "settings": {key: getattr(args, key) for key in WORKLOAD},
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                },
+                f,
+                indent=2,
+            )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
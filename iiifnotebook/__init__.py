@@ -1,2 +1,13 @@
 # from .mainOld import IIIFviewerAbsolute
-from .main import IIIFviewer
\ No newline at end of file
+from .core import IIIFcore
+
+__all__ = ["IIIFcore", "IIIFviewer"]
+
+
+def __getattr__(name):
+    # the viewer needs matplotlib and ipywidgets, imported only when used
+    if name == "IIIFviewer":
+        from .main import IIIFviewer
+
+        return IIIFviewer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
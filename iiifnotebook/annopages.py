@@ -0,0 +1,129 @@
+"""
+Loading of the annotation pages that a canvas references by id instead of
+embedding them. The pages are requested concurrently, the `next` pages of
+paginated transcriptions are requested as soon as the page linking them
+arrives, and every page is yielded as soon as it is available, so the first
+one can be shown while the rest are downloaded.
+"""
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import warning
+import json
+import threading
+
+from .fetcher import DownloadCancelled
+
+
+def _ref(link):
+    """The id of a link, which can be a string or an object with an id."""
+    if isinstance(link, dict):
+        return link.get("id", link.get("@id"))
+    return link
+
+
+class AnnotationPageLoader:
+    def __init__(self, fetcher, prefetcher=None, workers=4, max_pages=256):
+        """Download and keep the referenced annotation pages.
+
+        Args:
+            fetcher (Fetcher): Used for downloading (and its disk cache).
+            prefetcher (Prefetcher, optional): Pages already prefetched are
+            taken from it. Defaults to None.
+            workers (int, optional): Pages downloaded at the same time.
+            Defaults to 4.
+            max_pages (int, optional): Pages kept in memory, the least
+            recently used are dropped. Defaults to 256.
+        """
+        self.fetcher = fetcher
+        self.prefetcher = prefetcher
+        self.workers = workers
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        # not the pool of the fetcher: iter_pages itself can run there
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers)
+        return self._executor
+
+    def __contains__(self, url):
+        return url in self._pages
+
+    def get(self, url, cancel=None):
+        """Return an annotation page, downloading it if needed.
+
+        Args:
+            url (str): The id of the page.
+            cancel (threading.Event, optional): When set the download is
+            interrupted and DownloadCancelled is raised. Defaults to None.
+        """
+        with self._lock:
+            if url in self._pages:
+                self._pages.move_to_end(url)
+                return self._pages[url]
+        page = None
+        if self.prefetcher is not None:
+            page = self.prefetcher.get_json(url, cancel)
+        if page is None:
+            page = json.loads(self.fetcher.get_bytes(url, cancel))
+        with self._lock:
+            self._pages[url] = page
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return page
+
+    def iter_pages(self, refs, cancel=None):
+        """Yield the pages referenced and the pages following them.
+
+        Args:
+            refs (list): The ids of the pages (or AnnotationCollections, whose
+            first page is followed).
+            cancel (threading.Event, optional): Stop when it is set, also
+            interrupting the downloads in progress. Defaults to None.
+
+        Yields:
+            dict: The pages with items, in the order they arrive.
+        """
+        seen = set(refs)
+        pending = {self.executor.submit(self.get, url, cancel): url for url in refs}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    if cancel is not None and cancel.is_set():
+                        return
+                    try:
+                        page = future.result()
+                    except DownloadCancelled:
+                        return
+                    except (OSError, ValueError) as e:
+                        warning(f"Could not load the annotation page {url}: {e}")
+                        continue
+                    for link in (page.get("first"), page.get("next")):
+                        following = _ref(link)
+                        if following is not None and following not in seen:
+                            seen.add(following)
+                            pending[
+                                self.executor.submit(self.get, following, cancel)
+                            ] = following
+                    if "items" in page:
+                        yield page
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def items(self, refs):
+        """Return all the annotations of the pages referenced."""
+        return [item for page in self.iter_pages(refs) for item in page["items"]]
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
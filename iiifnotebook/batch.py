@@ -0,0 +1,186 @@
+"""
+Processing of all the canvases of a manifest with a function, for image
+analysis over whole manuscripts. The images are downloaded by the threads of
+the fetcher while a pool of processes decodes them and runs the function, so
+the network and the cores are busy at the same time. The results can be
+checkpointed to a file, and a run interrupted resumes from the canvases not
+processed yet.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from logging import warning
+import os
+import pickle
+
+from .fetcher import decode_image
+
+
+class _Inline:
+    """Stand-in for the process pool when workers is 0."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def _apply(func, data):
+    # runs in the worker process: decoding is CPU bound as well
+    if isinstance(data, bytes):
+        data = decode_image(data)
+    return func(data)
+
+
+def _read(fetcher, url):
+    if fetcher.pack is not None and fetcher.pack.is_image(url):
+        return fetcher.pack.imread(url)
+    if url.startswith(("http://", "https://")):
+        return fetcher.get_bytes(url)
+    with open(url, "rb") as f:
+        return f.read()
+
+
+def load_checkpoint(path):
+    """Return the results stored in a checkpoint file as {canvas: result}.
+
+    A record truncated by an interrupted run is ignored.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "rb") as f:
+        while True:
+            try:
+                canvas, result = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                break
+            results[canvas] = result
+    return results
+
+
+def map_canvases(
+    core,
+    func,
+    canvases=None,
+    size="max",
+    region=None,
+    rotation=0,
+    quality="default",
+    fmt="jpg",
+    choice=0,
+    workers=None,
+    ordered=True,
+    checkpoint=None,
+    max_pending=None,
+):
+    """Apply a function to the images of many canvases in parallel.
+
+    Args:
+        core (IIIFcore): The opened manifest.
+        func (callable): Called with the image (numpy array) of a canvas. It
+        runs in another process, so it must be picklable (defined at the top
+        level of a module) and so must its result.
+        canvases (list, optional): The canvas indices. Defaults to all.
+        size (str, optional): The size parameter. Defaults to "max".
+        region (str, optional): The region parameter. Defaults to the region
+        of the ImageApiSelector of each canvas or "full".
+        rotation (int, optional): Defaults to 0.
+        quality (str, optional): Defaults to "default".
+        fmt (str, optional): Defaults to "jpg".
+        choice (int, optional): The layer of Choice canvases. Defaults to 0.
+        workers (int, optional): Number of processes. 0 runs the function in
+        the calling process. Defaults to the number of CPUs.
+        ordered (bool, optional): Yield the results in the order of the
+        canvases, otherwise as soon as they are ready. Defaults to True.
+        checkpoint (str, optional): File where each result is appended as
+        soon as it is ready. The canvases already in it are not downloaded
+        again and their stored results are yielded. Defaults to None.
+        max_pending (int, optional): Canvases downloaded or processed at the
+        same time, which bounds the memory used. Defaults to twice the
+        number of processes plus the download threads.
+
+    Yields:
+        tuple: The canvas index and the result of the function. Canvases
+        whose image cannot be downloaded are skipped with a warning (and
+        retried by the next run with the same checkpoint).
+    """
+    fetcher = core.fetcher
+    if canvases is None:
+        canvases = range(len(core.canvas_index))
+    canvases = list(canvases)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * max(workers, 1) + fetcher.workers
+    done_results = load_checkpoint(checkpoint) if checkpoint is not None else {}
+    todo = iter([c for c in canvases if c not in done_results])
+    # canvas -> result (or skipped) waiting to be yielded in order
+    skipped = object()
+    ready = {c: done_results[c] for c in canvases if c in done_results}
+    position = 0
+    if not ordered:
+        for canvas in canvases:
+            if canvas in ready:
+                yield canvas, ready.pop(canvas)
+    pool = ProcessPoolExecutor(workers) if workers > 0 else _Inline()
+    out = open(checkpoint, "ab") if checkpoint is not None else None
+    downloads = {}
+    computes = {}
+    try:
+        while True:
+            while len(downloads) + len(computes) < max_pending:
+                canvas = next(todo, None)
+                if canvas is None:
+                    break
+                url = core.get_imageURL(
+                    canvas, region, size, rotation, quality, fmt, choice
+                )
+                if url is None:
+                    warning(f"The canvas {canvas} does not have an image.")
+                    ready[canvas] = skipped
+                    continue
+                downloads[fetcher.submit(_read, fetcher, url)] = canvas
+            while ordered and position < len(canvases):
+                canvas = canvases[position]
+                if canvas not in ready:
+                    break
+                result = ready.pop(canvas)
+                position += 1
+                if result is not skipped:
+                    yield canvas, result
+            if not downloads and not computes:
+                break
+            finished, _ = wait(
+                list(downloads) + list(computes), return_when=FIRST_COMPLETED
+            )
+            for future in finished:
+                if future in downloads:
+                    canvas = downloads.pop(future)
+                    try:
+                        data = future.result()
+                    except (OSError, ValueError) as e:
+                        warning(f"Could not download the canvas {canvas}: {e}")
+                        ready[canvas] = skipped
+                        continue
+                    computes[pool.submit(_apply, func, data)] = canvas
+                    continue
+                canvas = computes.pop(future)
+                result = future.result()
+                if out is not None:
+                    pickle.dump((canvas, result), out)
+                    out.flush()
+                if ordered:
+                    ready[canvas] = result
+                else:
+                    yield canvas, result
+    finally:
+        for future in downloads:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+        if out is not None:
+            out.close()
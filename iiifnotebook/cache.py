@@ -0,0 +1,255 @@
+"""
+Persistent cache of the downloaded resources (manifests, info.json and IIIF
+image responses). Entries are keyed by the full URL, so a IIIF image request
+{service}/{region}/{size}/{rotation}/{quality}.{format} is reused only when
+byte-identical. The least recently used entries are evicted when the size
+budget is exceeded and the freshness declared by the HTTP cache headers is
+respected.
+"""
+from email.utils import parsedate_to_datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def freshness(headers, default_ttl):
+    """Compute how long a response can be reused from the HTTP headers.
+
+    Args:
+        headers (Mapping): The headers of the response.
+        default_ttl (float): Lifetime in seconds used when the server does
+        not declare one.
+
+    Returns:
+        float: Seconds the response is fresh for, None if it must not be
+        stored at all.
+    """
+    cachecontrol = headers.get("Cache-Control", "").lower()
+    directives = {}
+    for directive in cachecontrol.split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            return float(directives[name])
+    if "Expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            return 0
+        return max(0, expires - time.time())
+    return default_ttl
+
+
+class CacheEntry:
+    __slots__ = ("url", "path", "size", "expires", "etag", "last_modified")
+
+    def __init__(self, url, path, size, expires, etag, last_modified):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fresh(self):
+        return self.expires > time.time()
+
+    def validators(self):
+        """Headers for revalidating the entry with a conditional request."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def read(self):
+        """Return the content, None if the file was evicted meanwhile."""
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class DiskCache:
+    # access times kept in memory before writing them to the index
+    flush_every = 256
+
+    def __init__(self, directory, max_bytes=2**30, default_ttl=7 * 24 * 3600):
+        """A content cache stored on disk with LRU eviction.
+
+        Args:
+            directory (str): Folder where the cached responses are stored.
+            It is created if it does not exist.
+            max_bytes (int, optional): Size budget of the cache. Defaults to
+            1 GiB.
+            default_ttl (int, optional): Seconds a response is considered
+            fresh when the server does not send cache headers. Defaults to a
+            week.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite"), check_same_thread=False
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "url TEXT PRIMARY KEY, size INTEGER, expires REAL, "
+            "etag TEXT, last_modified TEXT, accessed REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._db.commit()
+        self.total_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def _path(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def lookup(self, url):
+        """Return the entry of the URL (fresh or stale) or None if missing."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, expires, etag, last_modified FROM entries "
+                "WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._accessed[url] = time.time()
+            if len(self._accessed) >= self.flush_every:
+                self._flush()
+                self._db.commit()
+        return CacheEntry(url, self._path(url), *row)
+
+    def get(self, url):
+        """Return the cached content of the URL if fresh, otherwise None."""
+        entry = self.lookup(url)
+        if entry is None or not entry.fresh:
+            return None
+        return entry.read()
+
+    def _flush(self):
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE entries SET accessed = ? WHERE url = ?",
+                [(accessed, url) for url, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def flush(self):
+        """Write the access times recorded in memory to the index."""
+        with self._lock:
+            self._flush()
+            self._db.commit()
+
+    def put(self, url, data, headers=None):
+        """Store a response.
+
+        Args:
+            url (str): The URL of the resource.
+            data (bytes): The body of the response.
+            headers (Mapping, optional): The response headers used for
+            computing the freshness and the validators. Defaults to None.
+        """
+        headers = headers or {}
+        ttl = freshness(headers, self.default_ttl)
+        if ttl is None or len(data) > self.max_bytes:
+            return
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmppath = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmppath, "wb") as f:
+            f.write(data)
+        os.replace(tmppath, path)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+            if row is not None:
+                self.total_bytes -= row[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    len(data),
+                    now + ttl,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    now,
+                ),
+            )
+            self.total_bytes += len(data)
+            self._evict()
+            self._db.commit()
+
+    def refresh(self, url, headers):
+        """Extend the lifetime of an entry after a 304 Not Modified."""
+        ttl = freshness(headers, self.default_ttl) or 0
+        with self._lock:
+            self._accessed.pop(url, None)
+            self._db.execute(
+                "UPDATE entries SET expires = ?, accessed = ? WHERE url = ?",
+                (time.time() + ttl, time.time(), url),
+            )
+            self._db.commit()
+
+    def _delete(self, url, size):
+        self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+        self._accessed.pop(url, None)
+        self.total_bytes -= size
+        try:
+            os.remove(self._path(url))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        self._flush()
+        rows = self._db.execute(
+            "SELECT url, size FROM entries ORDER BY accessed"
+        ).fetchall()
+        for url, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._delete(url, size)
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        with self._lock:
+            for url, size in self._db.execute(
+                "SELECT url, size FROM entries"
+            ).fetchall():
+                self._delete(url, size)
+            self._db.commit()
+
+    def __contains__(self, url):
+        with self._lock:
+            return (
+                self._db.execute(
+                    "SELECT 1 FROM entries WHERE url = ?", (url,)
+                ).fetchone()
+                is not None
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
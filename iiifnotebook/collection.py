@@ -0,0 +1,193 @@
+"""
+Browsing of IIIF Collections. The members of a collection are wrapped in
+small records only when they are accessed, so collections with tens of
+thousands of manifests can be paged, searched and selected by index or id
+without printing or parsing all of them, and nested collections are
+downloaded only when opened.
+"""
+from itertools import islice
+
+from .utils import tryLanguage
+
+# the members of a collection in presentation API v.3 and v.2
+MEMBERKEYS = ("items", "members", "collections", "manifests")
+
+
+class CollectionItem:
+    __slots__ = ("index", "id", "type", "resource", "_label", "_language")
+
+    def __init__(self, index, resource, preferred_language="en"):
+        """A manifest or collection listed in a collection.
+
+        Args:
+            index (int): The position in the collection.
+            resource (dict): The member as listed in the collection.
+            preferred_language (str, optional): Defaults to 'en'.
+        """
+        self.index = index
+        self.resource = resource
+        self.id = resource.get("id", resource.get("@id"))
+        self.type = resource.get("type", resource.get("@type", "")).replace("sc:", "")
+        self._label = None
+        self._language = preferred_language
+
+    @property
+    def label(self):
+        """The label as text in the preferred language."""
+        if self._label is None:
+            label = self.resource.get("label", "")
+            if isinstance(label, dict):
+                label = tryLanguage(label, self._language, verbose=False)
+            elif isinstance(label, list):
+                label = " ".join(map(str, label))
+            self._label = str(label)
+        return self._label
+
+    @property
+    def is_collection(self):
+        return self.type == "Collection"
+
+    def __repr__(self):
+        return f"{self.index} - {self.type}: {self.label} {self.id}"
+
+
+class Collection:
+    def __init__(self, collection, fetcher=None, preferred_language="en"):
+        """A lazily parsed IIIF Collection.
+
+        Args:
+            collection (dict): The parsed collection.
+            fetcher (Fetcher, optional): Used for opening nested collections.
+            Defaults to a new Fetcher.
+            preferred_language (str, optional): Defaults to 'en'.
+        """
+        if fetcher is None:
+            from .fetcher import Fetcher
+
+            fetcher = Fetcher()
+        self.collection = collection
+        self.fetcher = fetcher
+        self.preferred_language = preferred_language
+        self.id = collection.get("id", collection.get("@id"))
+        self._members = []
+        for key in MEMBERKEYS:
+            self._members.extend(collection.get(key, []))
+        self._items = {}
+        self._byid = None
+
+    @classmethod
+    def from_url(cls, url, fetcher=None, preferred_language="en"):
+        """Download a collection."""
+        if fetcher is None:
+            from .fetcher import Fetcher
+
+            fetcher = Fetcher()
+        return cls(fetcher.get_json(url), fetcher, preferred_language)
+
+    @property
+    def label(self):
+        label = self.collection.get("label", "")
+        if isinstance(label, dict):
+            return tryLanguage(label, self.preferred_language, verbose=False)
+        return str(label)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._members)
+        if index not in self._items:
+            self._items[index] = CollectionItem(
+                index, self._members[index], self.preferred_language
+            )
+        return self._items[index]
+
+    def __iter__(self):
+        # the items are not kept, searching a large collection stays light
+        for index, member in enumerate(self._members):
+            item = self._items.get(index)
+            if item is None:
+                item = CollectionItem(index, member, self.preferred_language)
+            yield item
+
+    def page(self, number, size=50):
+        """Return the items of a page (the first page is 0)."""
+        start = number * size
+        return [self[i] for i in range(start, min(start + size, len(self)))]
+
+    def pages(self, size=50):
+        """Number of pages of the given size."""
+        return max(1, -(-len(self) // size))
+
+    def search(self, text):
+        """Yield the items whose label or id contains the text (ignoring the
+        case)."""
+        text = text.lower()
+        for item in self:
+            if text in item.label.lower() or text in (item.id or "").lower():
+                yield item
+
+    def manifests(self):
+        """Yield the manifests, skipping the nested collections."""
+        return (item for item in self if not item.is_collection)
+
+    def find(self, item_id):
+        """Return the position of the item with the given id."""
+        if self._byid is None:
+            self._byid = {
+                member.get("id", member.get("@id")): i
+                for i, member in enumerate(self._members)
+            }
+        return self._byid[item_id]
+
+    def select(self, key):
+        """Return an item by position or by id.
+
+        Args:
+            key (int or str): The position or the id of the item.
+
+        Raises:
+            ValueError: If there is no such item.
+        """
+        try:
+            if isinstance(key, str):
+                return self[self.find(key)]
+            return self[key]
+        except (KeyError, IndexError):
+            raise ValueError(f"{key} is not in the collection {self.id}.")
+
+    def open(self, key):
+        """Download a nested collection by position or id."""
+        item = self.select(key)
+        if not item.is_collection:
+            raise ValueError(f"{item.id} is not a Collection.")
+        return Collection.from_url(item.id, self.fetcher, self.preferred_language)
+
+    def prompt(self, size=20):
+        """Ask for an item on the console, showing one page at a time.
+
+        Returns:
+            CollectionItem: The item chosen.
+        """
+        number = 0
+        while True:
+            print(f"{self.label} ({len(self)} items)")
+            for item in self.page(number, size):
+                print(item)
+            answer = input(
+                f"Page {number + 1}/{self.pages(size)}. Index or id, "
+                "n/p for next/previous page, /text to search: "
+            ).strip()
+            if answer == "n":
+                number = min(number + 1, self.pages(size) - 1)
+            elif answer == "p":
+                number = max(number - 1, 0)
+            elif answer.startswith("/"):
+                for item in islice(self.search(answer[1:]), size):
+                    print(item)
+            else:
+                try:
+                    return self.select(int(answer) if answer.isdigit() else answer)
+                except ValueError as e:
+                    print(e)
@@ -0,0 +1,318 @@
+"""
+The headless part of the viewer: opening manifests and collections, building
+the image URLs of the canvases and downloading images, stacks and arrays.
+It does not import matplotlib, ipywidgets or IPython, and the image decoder
+and the HTTP library are loaded on first use, so batch scripts and worker
+processes start quickly.
+"""
+from .annopages import AnnotationPageLoader
+from .cache import DiskCache
+from .collection import Collection
+from .fetcher import Fetcher
+from .imageservice import ImageInfo
+from .index import CanvasIndex
+from .instrument import Profiler
+from . import utils
+
+
+class IIIFcore:
+    def __init__(
+        self,
+        url,
+        preferred_language="en",
+        workers=8,
+        max_per_host=6,
+        cache_dir=None,
+        cache_size=2**30,
+        select=None,
+        manifest_index=None,
+        pack=None,
+        profile=False,
+        load=True,
+    ):
+        """Read a IIIF manifest (presentation API v.3) without displaying it.
+
+        Args:
+            url (str): The url of the manifest or of a collection. It can be
+            None when a pack is given.
+            preferred_language (str, optional): Defaults to 'en'.
+            workers (int, optional): Number of threads used for downloading
+            images concurrently. Defaults to 8.
+            max_per_host (int, optional): Maximum number of connections open
+            to the same server. Defaults to 6.
+            cache_dir (str, optional): Folder where manifests and images are
+            cached between sessions. Defaults to None.
+            cache_size (int, optional): Size budget in bytes of the cache.
+            Defaults to 1 GiB.
+            select (int, str or list, optional): When the url is a Collection,
+            the index or id of the manifest to open, or a list of them for
+            nested collections. If None the manifest is asked on the console.
+            Defaults to None.
+            manifest_index (ManifestIndex or str, optional): A local index
+            built with crawler.crawl (or the path of its database). Defaults
+            to None.
+            pack (Pack or str, optional): An offline pack written by
+            export_pack (or the path of its zip file). The manifest, pages
+            and images stored in it are read without the network. Defaults
+            to None.
+            profile (bool, optional): Time the downloads and decoding and
+            count the cache hits in the profiler attribute. Defaults to
+            False.
+            load (bool, optional): Download the manifest immediately.
+            Defaults to True.
+        """
+        if isinstance(pack, str):
+            from .pack import Pack
+
+            pack = Pack(pack)
+        if url is None and pack is not None:
+            url = pack.url
+        self.url = url
+        self.preferred_language = preferred_language
+        self.select = select
+        if isinstance(manifest_index, str):
+            from .crawler import ManifestIndex
+
+            manifest_index = ManifestIndex(manifest_index)
+        self.manifest_index = manifest_index
+        self.collection = None
+        cache = None
+        if cache_dir is not None:
+            cache = DiskCache(cache_dir, max_bytes=cache_size)
+        self.profiler = Profiler(enabled=profile)
+        self.fetcher = Fetcher(
+            workers=workers,
+            max_per_host=max_per_host,
+            cache=cache,
+            pack=pack,
+            profiler=self.profiler,
+        )
+        self.annotationpages = AnnotationPageLoader(self.fetcher)
+        self.prefetcher = None
+        self.manifest = None
+        self.canvas_index = None
+        self._imageinfos = {}
+        if load:
+            self.load()
+
+    def load(self):
+        """Download (or read from the local index) and index the manifest."""
+        mnf = self.requestResource(self.url)
+        self.canvas_index = CanvasIndex(mnf)
+        return mnf
+
+    def requestResource(self, url, path=None):
+        """Return the manifest at the URL, choosing one if it is a collection.
+
+        Args:
+            url (str): The url of the manifest or collection.
+            path (list, optional): The items to choose in the collection and
+            in the nested ones. Defaults to the select argument.
+
+        Raises:
+            ValueError: If the manifest cannot be read.
+        """
+        mnf = None
+        if self.manifest_index is not None:
+            mnf = self.manifest_index.get(url)
+        try:
+            if mnf is None:
+                mnf = self.fetcher.get_json(url)
+        except (OSError, ValueError):
+            mnf = None
+        if mnf is None:
+            raise ValueError("Could not get the Manifest.")
+        # TODO: why I can't read the self.manifest
+        self.manifest = mnf
+        if mnf["type"] == "Collection":
+            self.collection = Collection(mnf, self.fetcher, self.preferred_language)
+            if path is None:
+                path = self.select
+            if path is None:
+                item = self.collection.prompt()
+                return self.requestResource(item.id)
+            if not isinstance(path, (list, tuple)):
+                path = [path]
+            if not path:
+                raise ValueError("The selection ends on a Collection.")
+            item = self.collection.select(path[0])
+            return self.requestResource(item.id, list(path[1:]))
+        return mnf
+
+    def __len__(self):
+        return len(self.canvas_index)
+
+    def get_imageURL(
+        self,
+        canvasIndex,
+        region=None,
+        size="max",
+        rotation=0,
+        quality="default",
+        fmt="jpg",
+        choice=0,
+    ):
+        """Return the URL of the image of a canvas, see CanvasIndex.image_url."""
+        return self.canvas_index.image_url(
+            canvasIndex, region, size, rotation, quality, fmt, choice
+        )
+
+    def get_image(self, canvasIndex, region=None, size="max", **kwargs):
+        """Download the image of a canvas as a numpy array, see get_imageURL
+        for the arguments."""
+        return self.fetcher.imread(
+            self.get_imageURL(canvasIndex, region, size, **kwargs)
+        )
+
+    def get_imageInfo(self, service_url):
+        """Return the info.json of an image service.
+
+        Args:
+            service_url (str): The id of the image service.
+
+        Returns:
+            ImageInfo: The parsed info.json.
+        """
+        if service_url not in self._imageinfos:
+            self._imageinfos[service_url] = ImageInfo.from_service(
+                self.fetcher, service_url
+            )
+        return self._imageinfos[service_url]
+
+    def get_datafromURLs(self, urls, filename=None):
+        if isinstance(urls, list):
+            from .stack import read_stack
+
+            data = read_stack(self.fetcher, urls, filename=filename)
+        else:
+            data = self.fetcher.imread(urls)
+        return data
+
+    def get_layers(
+        self,
+        canvasIndex,
+        region=None,
+        size="max",
+        rotation=0,
+        quality="default",
+        fmt="jpg",
+        filename=None,
+    ):
+        """Return the layers of a canvas (e.g. the bands of a multispectral
+        Choice) stacked in a single array.
+
+        Args:
+            canvasIndex (int): The canvas.
+            region (str, optional): Defaults to the region of the
+            ImageApiSelector of the canvas or "full".
+            size (str, optional): Defaults to "max". "auto" is read as "max",
+            there are no axes to fit.
+            rotation (int, optional): Defaults to 0.
+            quality (str, optional): Defaults to "default".
+            fmt (str, optional): Defaults to "jpg".
+            filename (str, optional): A .npy file where the stack is written
+            and memory mapped. Defaults to None.
+
+        Returns:
+            tuple: The stack (height, width, channels) and the labels of the
+            layers.
+        """
+        record = self.canvas_index[canvasIndex]
+        if size == "auto":
+            size = "max"
+        urls = self.canvas_index.choice_urls(
+            canvasIndex,
+            region=region,
+            size=size,
+            rotation=rotation,
+            quality=quality,
+            fmt=fmt,
+        )
+        labels = [
+            (
+                utils.tryLanguage(layer.label, self.preferred_language)
+                if layer.label is not None
+                else str(i)
+            )
+            for i, layer in enumerate(record.layers)
+        ]
+        return self.get_datafromURLs(urls, filename=filename), labels
+
+    def get_array(
+        self, canvasIndex, choice=0, chunk=1024, quality="default", fmt="jpg"
+    ):
+        """Return a lazy numpy-like view of the image of a canvas.
+
+        Slicing it (e.g. arr[1000:2000, 500:900] or arr[::8, ::8]) requests
+        only the needed regions to the image service, in cached chunks.
+
+        Args:
+            canvasIndex (int): The canvas.
+            choice (int, optional): The layer of a Choice. Defaults to 0.
+            chunk (int, optional): Side in pixels of the chunks requested.
+            Defaults to 1024.
+            quality (str, optional): Defaults to "default".
+            fmt (str, optional): Defaults to "jpg".
+
+        Returns:
+            IIIFArray: The view of the full resolution image.
+        """
+        from .lazyarray import IIIFArray
+
+        record = self.canvas_index[canvasIndex]
+        layer = record.layer(choice)
+        if layer.service_id is None:
+            raise ValueError("The image of the canvas does not have a service.")
+        try:
+            info = self.get_imageInfo(layer.service_id)
+            width, height = info.width, info.height
+        except (OSError, ValueError, KeyError):
+            width, height = record.width, record.height
+        return IIIFArray(
+            self.fetcher,
+            layer.service_id,
+            width,
+            height,
+            chunk=chunk,
+            quality=quality,
+            fmt=fmt,
+        )
+
+    def map_canvases(self, func, canvases=None, size="max", region=None, **kwargs):
+        """Apply a function to the images of many canvases with a pool of
+        processes, downloading the next images while they compute.
+
+        Example:
+            for canvas, mean in core.map_canvases(np.mean, size="1000,"):
+                ...
+
+        See batch.map_canvases for the other arguments (workers, ordered,
+        checkpoint...).
+
+        Yields:
+            tuple: The canvas index and the result of the function.
+        """
+        from .batch import map_canvases
+
+        return map_canvases(self, func, canvases, size, region, **kwargs)
+
+    def export_pack(self, path, sizes=("400,", "max"), **kwargs):
+        """Store the manifest, its annotation pages and its images in an
+        offline pack, which IIIFcore and IIIFviewer can open with
+        pack=path. See pack.export_pack for the other arguments.
+
+        Returns:
+            Pack: The pack written.
+        """
+        from .pack import export_pack
+
+        return export_pack(self, path, sizes, **kwargs)
+
+    def close(self):
+        """Stop the worker threads and close the connections."""
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        self.annotationpages.close()
+        self.fetcher.close()
+        if self.fetcher.pack is not None:
+            self.fetcher.pack.close()
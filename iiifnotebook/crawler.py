@@ -0,0 +1,254 @@
+"""
+Crawling of IIIF Collections into a local index. Collections are walked
+recursively with a bounded number of concurrent downloads and a minimum
+interval between requests to the same host. For every manifest the label,
+the canvases with their size and image services, and the manifest itself are
+stored in a sqlite database, which later runs update incrementally and the
+viewer can open manifests from without downloading them again.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import json
+from logging import warning
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+import zlib
+
+from .index import CanvasIndex
+from .utils import tryLanguage
+
+
+class RateLimiter:
+    def __init__(self, interval=0.5):
+        """Space the requests to the same host.
+
+        Args:
+            interval (float, optional): Minimum seconds between two requests
+            to the same host. Defaults to 0.5.
+        """
+        self.interval = interval
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until a request to the host of the URL is allowed."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class ManifestIndex:
+    def __init__(self, path):
+        """A local index of manifests and collections stored with sqlite.
+
+        Args:
+            path (str): The database file, created if it does not exist.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, type TEXT, label TEXT, parent TEXT, "
+            "canvases INTEGER, crawled REAL, data BLOB);"
+            "CREATE TABLE IF NOT EXISTS canvases ("
+            "manifest TEXT, idx INTEGER, id TEXT, label TEXT, width INTEGER, "
+            "height INTEGER, service TEXT, PRIMARY KEY (manifest, idx));"
+            "CREATE INDEX IF NOT EXISTS canvases_service ON canvases (service);"
+        )
+        self._db.commit()
+
+    def __contains__(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM documents WHERE id = ?", (url,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM documents WHERE type = 'Manifest'"
+            ).fetchone()[0]
+
+    def crawled(self, url):
+        """Return when the document was stored (seconds since the epoch) or
+        None if it is not in the index."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT crawled FROM documents WHERE id = ?", (url,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, url, document, parent=None, preferred_language="en"):
+        """Store a manifest (with its canvases) or a collection.
+
+        Args:
+            url (str): The URL the document was downloaded from.
+            document (dict): The parsed manifest or collection.
+            parent (str, optional): The collection listing it. Defaults to
+            None.
+            preferred_language (str, optional): Language of the labels stored.
+            Defaults to 'en'.
+        """
+        label = document.get("label", "")
+        if isinstance(label, dict):
+            label = tryLanguage(label, preferred_language, verbose=False)
+        doctype = document.get("type", document.get("@type", ""))
+        rows = []
+        if doctype == "Manifest":
+            for record in CanvasIndex(document):
+                canvaslabel = record.label
+                if isinstance(canvaslabel, dict):
+                    canvaslabel = tryLanguage(
+                        canvaslabel, preferred_language, verbose=False
+                    )
+                rows.append(
+                    (
+                        url,
+                        record.index,
+                        record.id,
+                        canvaslabel,
+                        record.width,
+                        record.height,
+                        record.service_id,
+                    )
+                )
+        data = zlib.compress(json.dumps(document).encode("utf-8"))
+        with self._lock:
+            self._db.execute("DELETE FROM canvases WHERE manifest = ?", (url,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, doctype, str(label), parent, len(rows), time.time(), data),
+            )
+            self._db.executemany(
+                "INSERT INTO canvases VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def get(self, url):
+        """Return the stored manifest or collection, or None if missing."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM documents WHERE id = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def manifests(self, search=None):
+        """Return (id, label, number of canvases) of the manifests indexed,
+        optionally only those whose label contains the search text."""
+        query = "SELECT id, label, canvases FROM documents WHERE type = 'Manifest'"
+        args = ()
+        if search is not None:
+            query += " AND label LIKE ?"
+            args = (f"%{search}%",)
+        with self._lock:
+            return self._db.execute(query + " ORDER BY id", args).fetchall()
+
+    def canvases(self, manifest):
+        """Return (index, id, label, width, height, image service id) of the
+        canvases of a manifest."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT idx, id, label, width, height, service FROM canvases "
+                "WHERE manifest = ? ORDER BY idx",
+                (manifest,),
+            ).fetchall()
+
+    def close(self):
+        self._db.close()
+
+
+def _members(collection):
+    for key in ("items", "members", "collections", "manifests"):
+        for member in collection.get(key, []):
+            url = member.get("id", member.get("@id"))
+            if url is not None:
+                yield url, member.get("type", member.get("@type", ""))
+
+
+def crawl(
+    url,
+    index,
+    fetcher=None,
+    workers=8,
+    interval=0.5,
+    max_age=None,
+    preferred_language="en",
+):
+    """Index all the manifests reachable from a collection.
+
+    Collections are always downloaded again, for discovering new members.
+    Manifests already in the index are skipped unless older than max_age.
+
+    Args:
+        url (str): The collection (or a single manifest).
+        index (ManifestIndex or str): The index, or the path of its database.
+        fetcher (Fetcher, optional): Used for downloading. Defaults to a new
+        Fetcher.
+        workers (int, optional): Maximum concurrent downloads. Defaults to 8.
+        interval (float, optional): Minimum seconds between two requests to
+        the same host. Defaults to 0.5.
+        max_age (float, optional): Seconds after which an indexed manifest is
+        downloaded again. Defaults to None (never).
+        preferred_language (str, optional): Defaults to 'en'.
+
+    Returns:
+        dict: How many manifests were indexed and skipped, collections
+        visited and errors.
+    """
+    if fetcher is None:
+        from .fetcher import Fetcher
+
+        fetcher = Fetcher(workers=workers)
+    if isinstance(index, str):
+        index = ManifestIndex(index)
+    limiter = RateLimiter(interval)
+    stats = {"manifests": 0, "skipped": 0, "collections": 0, "errors": 0}
+
+    def fetch(target):
+        limiter.wait(target)
+        return fetcher.get_json(target)
+
+    def stale(target):
+        crawled = index.crawled(target)
+        if crawled is None:
+            return True
+        return max_age is not None and time.time() - crawled > max_age
+
+    seen = {url}
+    with ThreadPoolExecutor(workers) as executor:
+        pending = {executor.submit(fetch, url): (url, None)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                target, parent = pending.pop(future)
+                try:
+                    document = future.result()
+                except (OSError, ValueError) as e:
+                    warning(f"Could not crawl {target}: {e}")
+                    stats["errors"] += 1
+                    continue
+                index.put(target, document, parent, preferred_language)
+                if not document.get("type", document.get("@type", "")).endswith(
+                    "Collection"
+                ):
+                    stats["manifests"] += 1
+                    continue
+                stats["collections"] += 1
+                for member, membertype in _members(document):
+                    if member in seen:
+                        continue
+                    seen.add(member)
+                    if not membertype.endswith("Collection") and not stale(member):
+                        stats["skipped"] += 1
+                        continue
+                    pending[executor.submit(fetch, member)] = (member, target)
+    return stats
@@ -0,0 +1,236 @@
+"""
+Network layer shared by the viewer. A single pooled HTTP session keeps the
+connections to the image servers alive and a pool of worker threads downloads
+and decodes lists of URLs concurrently.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import json
+import threading
+
+from .instrument import Profiler
+
+
+class DownloadCancelled(Exception):
+    """Raised when a download is abandoned because it is no longer needed."""
+
+
+def decode_image(data):
+    """Decode the bytes of an image into a numpy array.
+
+    Args:
+        data (bytes): The encoded image (jpg, png, tif...).
+
+    Returns:
+        numpy.ndarray: The decoded image.
+    """
+    # skimage is slow to import, we load it only when an image is decoded.
+    from skimage import io
+
+    return io.imread(BytesIO(data))
+
+
+class Fetcher:
+    def __init__(
+        self,
+        workers=8,
+        max_per_host=6,
+        timeout=60,
+        cache=None,
+        pack=None,
+        profiler=None,
+    ):
+        """Download IIIF resources using a pooled keep-alive session.
+
+        Args:
+            workers (int, optional): Number of threads used for fetching
+            lists of URLs concurrently. Defaults to 8.
+            max_per_host (int, optional): Maximum number of open connections
+            to the same host. Requests exceeding it wait for a free
+            connection. Defaults to 6.
+            timeout (int, optional): Timeout in seconds of each request.
+            Defaults to 60.
+            cache (DiskCache, optional): Cache where the responses are stored
+            and looked up before contacting the server. Defaults to None.
+            pack (Pack, optional): Offline pack whose resources are read
+            from it instead of the server. Defaults to None.
+            profiler (Profiler, optional): Times the downloads and decoding
+            and counts the cache hits. Defaults to a disabled one.
+        """
+        self.workers = workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.cache = cache
+        self.pack = pack
+        self.profiler = profiler if profiler is not None else Profiler()
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The pooled requests session, created on first use."""
+        with self._lock:
+            if self._session is None:
+                # requests is imported here, reading from the cache alone
+                # does not need it
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                self._session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.workers,
+                    pool_maxsize=self.max_per_host,
+                    pool_block=True,
+                )
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    @property
+    def executor(self):
+        """The worker pool, created on first use."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="iiifnotebook"
+                )
+            return self._executor
+
+    def get(self, url, **kwargs):
+        """Perform a GET request using the pooled session.
+
+        Args:
+            url (str): The URL of the resource.
+
+        Returns:
+            requests.Response: The response of the server.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def get_json(self, url):
+        """Return the JSON document at the URL (e.g. a manifest or info.json)."""
+        return json.loads(self.get_bytes(url))
+
+    def _download(self, url, headers=None, cancel=None):
+        if cancel is None:
+            return self.get(url, headers=headers), None
+        # streamed, so that the download can stop between two chunks
+        response = self.get(url, headers=headers, stream=True)
+        if not response.ok:
+            return response, None
+        chunks = []
+        with response:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if cancel.is_set():
+                    raise DownloadCancelled(url)
+                chunks.append(chunk)
+        return response, b"".join(chunks)
+
+    def get_bytes(self, url, cancel=None):
+        """Return the raw content of the resource at the URL.
+
+        If a cache is set, fresh entries are returned without contacting the
+        server and stale ones are revalidated with a conditional request.
+
+        Args:
+            url (str): The URL of the resource.
+            cancel (threading.Event, optional): When set the download is
+            interrupted and DownloadCancelled is raised. Defaults to None.
+        """
+        if cancel is not None and cancel.is_set():
+            raise DownloadCancelled(url)
+        profiler = self.profiler
+        if self.pack is not None and url in self.pack:
+            profiler.count("pack.hit")
+            return self.pack.get_bytes(url)
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(url)
+            if entry is not None and entry.fresh:
+                data = entry.read()
+                if data is not None:
+                    profiler.count("cache.hit")
+                    return data
+                # evicted by another thread after the lookup
+                entry = None
+            profiler.count("cache.miss")
+        headers = entry.validators() if entry is not None else {}
+        with profiler.stage("fetch", url=url) as fields:
+            response, content = self._download(url, headers, cancel)
+            if entry is not None and response.status_code == 304:
+                self.cache.refresh(url, response.headers)
+                data = entry.read()
+                if data is not None:
+                    profiler.count("cache.revalidated")
+                    return data
+                response, content = self._download(url, {}, cancel)
+            response.raise_for_status()
+            if content is None:
+                content = response.content
+            fields["bytes"] = len(content)
+        if self.cache is not None:
+            self.cache.put(url, content, response.headers)
+        return content
+
+    def is_cached(self, url):
+        """True if the resource can be read from the cache without requests."""
+        if self.pack is not None and url in self.pack:
+            return True
+        if self.cache is None:
+            return False
+        entry = self.cache.lookup(url)
+        return entry is not None and entry.fresh
+
+    def imread(self, url, cancel=None):
+        """Download and decode an image.
+
+        Args:
+            url (str): The URL of the image. Local paths are read directly.
+            cancel (threading.Event, optional): See get_bytes. Defaults to
+            None.
+
+        Returns:
+            numpy.ndarray: The decoded image.
+        """
+        if self.pack is not None and self.pack.is_image(url):
+            self.profiler.count("pack.hit")
+            return self.pack.imread(url)
+        if not url.startswith(("http://", "https://")):
+            from skimage import io
+
+            with self.profiler.stage("decode", url=url):
+                return io.imread(url)
+        data = self.get_bytes(url, cancel=cancel)
+        with self.profiler.stage("decode", url=url, bytes=len(data)):
+            return decode_image(data)
+
+    def submit(self, fn, *args, **kwargs):
+        """Run a function in the worker pool and return its future."""
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def imread_many(self, urls, cancel=None):
+        """Download and decode a list of images concurrently.
+
+        Args:
+            urls (list): The URLs of the images.
+            cancel (threading.Event, optional): When set the downloads stop
+            and DownloadCancelled is raised. Defaults to None.
+
+        Returns:
+            list: The decoded images in the same order of the URLs.
+        """
+        return list(self.executor.map(lambda url: self.imread(url, cancel), urls))
+
+    def close(self):
+        """Shut down the worker pool and close the pooled connections."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+        if self.cache is not None:
+            self.cache.flush()
@@ -0,0 +1,185 @@
+"""
+Geometry of regions: parsing of the region parameter of the Image API and of
+the #xywh= media fragments of annotation targets, and conversions between the
+pixels of the canvas, the pixels of the image and percentages. The functions
+work on arrays of boxes (x, y, width, height), so thousands of annotations are
+converted with a few numpy operations.
+"""
+import numpy as np
+
+PIXEL, PERCENT, FULL, SQUARE = 0, 1, 2, 3
+
+
+def parse_region(region):
+    """Split a region parameter or a media fragment in its unit and values.
+
+    Args:
+        region (str): "full", "square", "pct:x,y,w,h", "x,y,w,h" or a
+        fragment such as "#xywh=x,y,w,h", "xywh=percent:x,y,w,h" or a URL
+        ending with one.
+
+    Returns:
+        tuple: The unit (PIXEL, PERCENT, FULL or SQUARE) and the four values
+        (zeros for FULL and SQUARE).
+    """
+    if "xywh=" in region:
+        region = region.split("xywh=", 1)[1]
+    unit = PIXEL
+    if region.startswith("pct:"):
+        unit, region = PERCENT, region[len("pct:") :]
+    elif region.startswith("percent:"):
+        unit, region = PERCENT, region[len("percent:") :]
+    elif region.startswith("pixel:"):
+        region = region[len("pixel:") :]
+    elif region in ("full", "max", ""):
+        return FULL, (0.0, 0.0, 0.0, 0.0)
+    elif region == "square":
+        return SQUARE, (0.0, 0.0, 0.0, 0.0)
+    values = tuple(float(v) for v in region.split(","))
+    if len(values) != 4:
+        raise ValueError(f"Invalid region: {region}")
+    return unit, values
+
+
+def regions_to_boxes(regions, width, height):
+    """Convert many regions to boxes in pixels.
+
+    Args:
+        regions (list): Region parameters or fragments, see parse_region.
+        width (float): Width of the space (image or canvas) the regions refer
+        to.
+        height (float): Height of that space.
+
+    Returns:
+        numpy.ndarray: The boxes, shape (n, 4) as x, y, width, height.
+    """
+    parsed = [parse_region(region) for region in regions]
+    if not parsed:
+        return np.empty((0, 4))
+    units = np.array([unit for unit, _ in parsed])
+    boxes = np.array([values for _, values in parsed], dtype=float)
+    percent = units == PERCENT
+    boxes[percent] = pct_to_boxes(boxes[percent], width, height)
+    boxes[units == FULL] = (0, 0, width, height)
+    side = min(width, height)
+    boxes[units == SQUARE] = ((width - side) / 2, (height - side) / 2, side, side)
+    return boxes
+
+
+def region_box(region, width, height):
+    """Return the rectangle selected by a region parameter.
+
+    Args:
+        region (str): "full", "square", "pct:x,y,w,h" or "x,y,w,h".
+        width (int): Width of the full image.
+        height (int): Height of the full image.
+
+    Returns:
+        tuple: (x, y, width, height) in pixels of the full image.
+    """
+    return tuple(regions_to_boxes([region], width, height)[0].tolist())
+
+
+def pct_to_boxes(pct, width, height):
+    """Convert boxes in percentages to pixels of a width x height space."""
+    return np.asarray(pct, dtype=float) * np.array([width, height, width, height]) / 100
+
+
+def boxes_to_pct(boxes, width, height, decimals=None):
+    """Convert boxes in pixels to percentages of a width x height space.
+
+    Args:
+        boxes (array_like): Boxes (x, y, width, height), shape (n, 4) or (4,).
+        width (float): Width of the space.
+        height (float): Height of the space.
+        decimals (int, optional): Round the percentages. Defaults to None.
+
+    Returns:
+        numpy.ndarray: The boxes in percentages.
+    """
+    pct = (
+        np.asarray(boxes, dtype=float) * 100 / np.array([width, height, width, height])
+    )
+    if decimals is not None:
+        pct = np.round(pct, decimals)
+    return pct
+
+
+def rescale_boxes(boxes, source_size, target_size):
+    """Convert boxes between spaces of different sizes, e.g. from the canvas
+    to the image painted on it.
+
+    Args:
+        boxes (array_like): Boxes (x, y, width, height).
+        source_size (tuple): (width, height) of the space of the boxes.
+        target_size (tuple): (width, height) of the returned space.
+
+    Returns:
+        numpy.ndarray: The boxes.
+    """
+    sx = target_size[0] / source_size[0]
+    sy = target_size[1] / source_size[1]
+    return np.asarray(boxes, dtype=float) * np.array([sx, sy, sx, sy])
+
+
+def rotate_boxes(boxes, width, height, rotation):
+    """Transform boxes as the Image API transforms the image.
+
+    The rotation parameter is applied as the server does: the image is
+    mirrored first if it starts with "!", then rotated clockwise and the
+    result is the bounding box of the rotated image. For angles that are not
+    multiples of 90 the boxes returned bound the rotated boxes.
+
+    Args:
+        boxes (array_like): Boxes (x, y, width, height) in pixels.
+        width (float): Width of the image before rotating.
+        height (float): Height of the image before rotating.
+        rotation (str or float): The rotation parameter, e.g. 90 or "!180".
+
+    Returns:
+        numpy.ndarray: The boxes in the pixels of the rotated image.
+    """
+    boxes = np.array(boxes, dtype=float, ndmin=2)
+    rotation = str(rotation)
+    if rotation.startswith("!"):
+        boxes[:, 0] = width - boxes[:, 0] - boxes[:, 2]
+        rotation = rotation[1:]
+    angle = np.deg2rad(float(rotation) % 360)
+    cos, sin = np.cos(angle), np.sin(angle)
+    # corners (n, 4, 2), with the y axis pointing down a clockwise rotation
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    xs = np.stack([x0, x1, x1, x0], axis=1) - width / 2
+    ys = np.stack([y0, y0, y1, y1], axis=1) - height / 2
+    rx = xs * cos - ys * sin
+    ry = xs * sin + ys * cos
+    # the rotated image is translated so that its bounding box starts at 0
+    w = abs(width * cos) + abs(height * sin)
+    h = abs(width * sin) + abs(height * cos)
+    rx += w / 2
+    ry += h / 2
+    left, top = rx.min(axis=1), ry.min(axis=1)
+    out = np.stack([left, top, rx.max(axis=1) - left, ry.max(axis=1) - top], axis=1)
+    # remove the noise of sin and cos of multiples of 90
+    return np.round(out, 9)
+
+
+def format_region(box, pct=False, decimals=None):
+    """Format a box as a region parameter.
+
+    Args:
+        box (array_like): x, y, width, height.
+        pct (bool, optional): If True the box is in percentages and
+        "pct:x,y,w,h" is returned, otherwise the values are rounded to integer
+        pixels. Defaults to False.
+        decimals (int, optional): Round the percentages. Defaults to None.
+
+    Returns:
+        str: The region parameter.
+    """
+    values = np.asarray(box, dtype=float)
+    if not pct:
+        return ",".join(str(int(v)) for v in np.round(values))
+    if decimals is not None:
+        values = np.round(values, decimals)
+    return "pct:" + ",".join(np.format_float_positional(v, trim="-") for v in values)
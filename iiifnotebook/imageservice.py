@@ -0,0 +1,232 @@
+"""
+Helpers for the IIIF Image API services: reading info.json, choosing the
+level of the tile pyramid that matches the resolution of the screen and
+composing the visible tiles into a single image.
+"""
+import math
+
+import numpy as np
+
+from .geometry import region_box
+
+
+class ImageInfo:
+    def __init__(self, info):
+        """The technical properties of an image service read from info.json.
+
+        Args:
+            info (dict): The parsed info.json document.
+        """
+        self.info = info
+        self.id = info.get("id", info.get("@id"))
+        self.width = int(info["width"])
+        self.height = int(info["height"])
+        self.tiles = info.get("tiles", [])
+        self.sizes = [
+            (int(s["width"]), int(s["height"])) for s in info.get("sizes", [])
+        ]
+        context = info.get("@context", "")
+        if isinstance(context, list):
+            context = " ".join(context)
+        self.version = 2 if "image/2" in context else 3
+
+    @classmethod
+    def from_service(cls, fetcher, service_url):
+        """Download the info.json of a service (through the fetcher's cache)."""
+        return cls(fetcher.get_json(f"{service_url}/info.json"))
+
+    @property
+    def tile_size(self):
+        """Width and height of the tiles or None if the service has no tiles."""
+        if not self.tiles:
+            return None
+        tile = self.tiles[0]
+        return int(tile["width"]), int(tile.get("height", tile["width"]))
+
+    @property
+    def scale_factors(self):
+        factors = set()
+        for tile in self.tiles:
+            factors.update(int(i) for i in tile.get("scaleFactors", [1]))
+        return sorted(factors) or [1]
+
+    def choose_scale_factor(self, region_width, display_width):
+        """Return the coarsest level that still has enough pixels for the screen.
+
+        Args:
+            region_width (float): Width of the region in full resolution pixels.
+            display_width (float): Width in screen pixels where the region is
+            shown.
+
+        Returns:
+            int: The scale factor of the level.
+        """
+        ratio = region_width / max(display_width, 1)
+        chosen = self.scale_factors[0]
+        for factor in self.scale_factors:
+            if factor <= ratio:
+                chosen = factor
+        return chosen
+
+    def size_parameter(self, width, height):
+        """The size parameter of a request, as expected by the API version."""
+        if self.version == 2:
+            return f"{width},"
+        return f"{width},{height}"
+
+    def tiles_for_region(self, x, y, width, height, scale_factor):
+        """List the tiles of a level that intersect a region.
+
+        Args:
+            x (float): Left side of the region in full resolution pixels.
+            y (float): Top side of the region in full resolution pixels.
+            width (float): Width of the region.
+            height (float): Height of the region.
+            scale_factor (int): The level of the pyramid.
+
+        Returns:
+            list: Tuples (x, y, width, height, size) with the region of each
+            tile in full resolution pixels and its size parameter.
+        """
+        tilew, tileh = self.tile_size
+        stepx = tilew * scale_factor
+        stepy = tileh * scale_factor
+        x0 = max(0, int(x))
+        y0 = max(0, int(y))
+        x1 = min(self.width, int(math.ceil(x + width)))
+        y1 = min(self.height, int(math.ceil(y + height)))
+        tiles = []
+        for ty in range(y0 // stepy * stepy, y1, stepy):
+            for tx in range(x0 // stepx * stepx, x1, stepx):
+                tw = min(stepx, self.width - tx)
+                th = min(stepy, self.height - ty)
+                size = self.size_parameter(
+                    math.ceil(tw / scale_factor), math.ceil(th / scale_factor)
+                )
+                tiles.append((tx, ty, tw, th, size))
+        return tiles
+
+
+def negotiate_size(info, region, display_width, display_height, tolerance=0.25):
+    """Choose the size parameter for showing a region in a given screen area.
+
+    The smallest size giving at least one image pixel per screen pixel is
+    computed and, when one is close enough, replaced by a size the server
+    advertises in info.json (sizes, or a scale factor of the pyramid), which
+    is more likely to be pre-rendered or cached by the server and the CDN.
+
+    Args:
+        info (ImageInfo): The info.json of the service.
+        region (str): The region parameter of the request.
+        display_width (float): Width in screen pixels of the area.
+        display_height (float): Height in screen pixels of the area.
+        tolerance (float, optional): How many more pixels (as a fraction) an
+        advertised size can have for being preferred. Defaults to 0.25.
+
+    Returns:
+        str: The size parameter.
+    """
+    _, _, width, height = region_box(region, info.width, info.height)
+    scale = min(display_width / width, display_height / height)
+    if scale >= 1:
+        return "max"
+    needed = math.ceil(width * scale)
+    candidates = [
+        (math.ceil(width / factor), math.ceil(height / factor))
+        for factor in info.scale_factors
+    ]
+    if region == "full":
+        candidates += info.sizes
+    close = [c for c in candidates if needed <= c[0] <= needed * (1 + tolerance)]
+    if close:
+        return info.size_parameter(*min(close))
+    return f"{needed},"
+
+
+def region_url(service_url, region, size, rotation=0, quality="default", fmt="jpg"):
+    """Build the URL {service}/{region}/{size}/{rotation}/{quality}.{format}."""
+    return "/".join([service_url, region, size, str(rotation), f"{quality}.{fmt}"])
+
+
+def compose_tiles(tiles, images, scale_factor, allocate=np.zeros):
+    """Paste the tiles of one level into a single array.
+
+    Args:
+        tiles (list): The tiles as returned by ImageInfo.tiles_for_region.
+        images (list): The decoded images of the tiles.
+        scale_factor (int): The level of the tiles.
+        allocate (callable, optional): Returns the zeroed output array given
+        its shape and dtype. Defaults to numpy.zeros.
+
+    Returns:
+        tuple: The composed image and its extent (x0, x1, y0, y1) in full
+        resolution pixels.
+    """
+    x0 = min(t[0] for t in tiles)
+    y0 = min(t[1] for t in tiles)
+    x1 = max(t[0] + t[2] for t in tiles)
+    y1 = max(t[1] + t[3] for t in tiles)
+    channels = max(img.shape[2] if img.ndim == 3 else 1 for img in images)
+    shape = (
+        math.ceil((y1 - y0) / scale_factor),
+        math.ceil((x1 - x0) / scale_factor),
+    )
+    if channels > 1:
+        shape += (channels,)
+    composed = allocate(shape, images[0].dtype)
+    for (tx, ty, _, _, _), img in zip(tiles, images):
+        if channels > 1 and img.ndim == 2:
+            img = np.repeat(img[:, :, None], channels, axis=2)
+        elif channels > 1 and img.shape[2] < channels:
+            img = np.pad(img, ((0, 0), (0, 0), (0, channels - img.shape[2])))
+        row = (ty - y0) // scale_factor
+        col = (tx - x0) // scale_factor
+        h = min(img.shape[0], shape[0] - row)
+        w = min(img.shape[1], shape[1] - col)
+        composed[row : row + h, col : col + w] = img[:h, :w]
+    return composed, (x0, x1, y0, y1)
+
+
+def fetch_region_tiles(
+    fetcher,
+    info,
+    service_url,
+    x,
+    y,
+    width,
+    height,
+    display_width,
+    quality="default",
+    fmt="jpg",
+    allocate=np.zeros,
+    cancel=None,
+):
+    """Download concurrently only the tiles covering a region on screen.
+
+    Args:
+        fetcher (Fetcher): Used for downloading (and caching) the tiles.
+        info (ImageInfo): The info.json of the service.
+        service_url (str): The id of the image service.
+        x (float): Left side of the region in full resolution pixels.
+        y (float): Top side of the region in full resolution pixels.
+        width (float): Width of the region.
+        height (float): Height of the region.
+        display_width (float): Width in screen pixels of the region.
+        quality (str, optional): Defaults to "default".
+        fmt (str, optional): Defaults to "jpg".
+        allocate (callable, optional): See compose_tiles.
+        cancel (threading.Event, optional): Stops the downloads when set,
+        see Fetcher.imread_many. Defaults to None.
+
+    Returns:
+        tuple: The composed image and its extent (x0, x1, y0, y1) in full
+        resolution pixels.
+    """
+    factor = info.choose_scale_factor(width, display_width)
+    tiles = info.tiles_for_region(x, y, width, height, factor)
+    urls = [
+        region_url(service_url, f"{tx},{ty},{tw},{th}", size, 0, quality, fmt)
+        for tx, ty, tw, th, size in tiles
+    ]
+    images = fetcher.imread_many(urls, cancel)
+    return compose_tiles(tiles, images, factor, allocate)
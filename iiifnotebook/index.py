@@ -0,0 +1,197 @@
+"""
+A compact index of the canvases of a manifest. The manifest JSON is walked
+once (Canvas -> AnnotationPage -> painting Annotation -> body/Choice/service)
+and what is needed for showing and processing each canvas is stored in small
+__slots__ records, so that it can be looked up without walking the JSON again.
+"""
+from .imageservice import region_url
+
+IMAGEAPISELECTORS = ("iiif:ImageApiSelector", "ImageApiSelector")
+
+
+class ImageLayer:
+    __slots__ = (
+        "label",
+        "resource",
+        "image_id",
+        "service",
+        "service_id",
+        "service_type",
+    )
+
+    def __init__(self, resource):
+        """An image painted on a canvas (the body or one of the Choice items).
+
+        Args:
+            resource (dict): The content resource of the image.
+        """
+        self.label = resource.get("label")
+        self.resource = resource
+        self.image_id = resource.get("id")
+        self.service = None
+        self.service_id = None
+        self.service_type = None
+        for service in resource.get("service", []):
+            servicetype = service.get("type", service.get("@type", ""))
+            if servicetype.startswith("ImageService"):
+                self.service = service
+                self.service_id = service.get("id", service.get("@id"))
+                self.service_type = servicetype
+
+
+class CanvasRecord:
+    __slots__ = (
+        "index",
+        "id",
+        "label",
+        "width",
+        "height",
+        "layers",
+        "is_choice",
+        "selector_region",
+        "annotation_pages",
+        "annotation_refs",
+        "thumbnail",
+    )
+
+    def __init__(self, index, canvas):
+        """The parsed painting and annotation structure of a canvas.
+
+        Args:
+            index (int): The position of the canvas in the manifest.
+            canvas (dict): The canvas.
+        """
+        self.index = index
+        self.id = canvas.get("id")
+        self.label = canvas.get("label")
+        self.width = int(canvas["width"]) if "width" in canvas else None
+        self.height = int(canvas["height"]) if "height" in canvas else None
+        self.layers = ()
+        self.is_choice = False
+        self.selector_region = None
+        self.thumbnail = None
+        for thumbnail in canvas.get("thumbnail", []):
+            if thumbnail.get("type", "Image") == "Image" and "id" in thumbnail:
+                self.thumbnail = thumbnail["id"]
+                break
+        for cnvitm in canvas.get("items", []):
+            for ann in cnvitm.get("items", []):
+                if ann.get("motivation") != "painting" or self.layers:
+                    continue
+                body = ann["body"]
+                if body["type"] == "Choice":
+                    self.is_choice = True
+                    self.layers = tuple(ImageLayer(i) for i in body["items"])
+                elif body["type"] == "SpecificResource":
+                    self.layers = (ImageLayer(body["source"]),)
+                else:
+                    self.layers = (ImageLayer(body),)
+                selector = body.get("selector", {})
+                if selector.get("type") in IMAGEAPISELECTORS:
+                    self.selector_region = selector.get("region")
+        annotations = canvas.get("annotations", [])
+        self.annotation_pages = tuple(page for page in annotations if "items" in page)
+        self.annotation_refs = tuple(
+            page["id"] for page in annotations if "items" not in page and "id" in page
+        )
+
+    @property
+    def service_id(self):
+        """The id of the image service of the first layer (None if missing)."""
+        return self.layers[0].service_id if self.layers else None
+
+    @property
+    def service_type(self):
+        return self.layers[0].service_type if self.layers else None
+
+    def layer(self, choice=0):
+        """Return the layer of a Choice (the only layer for plain images)."""
+        if not isinstance(choice, int) or not 0 <= choice < len(self.layers):
+            choice = 0
+        return self.layers[choice]
+
+
+class CanvasIndex:
+    def __init__(self, manifest):
+        """Index the canvases of a manifest (presentation API v.3).
+
+        Args:
+            manifest (dict): The parsed manifest.
+        """
+        self.manifest = manifest
+        self.records = [
+            CanvasRecord(i, canvas)
+            for i, canvas in enumerate(manifest.get("items", []))
+        ]
+        self._byid = {record.id: record.index for record in self.records}
+
+    @classmethod
+    def from_url(cls, url, fetcher=None):
+        """Download a manifest and index it.
+
+        Args:
+            url (str): The URL of the manifest.
+            fetcher (Fetcher, optional): Used for downloading. Defaults to a
+            new Fetcher.
+        """
+        if fetcher is None:
+            from .fetcher import Fetcher
+
+            fetcher = Fetcher()
+        return cls(fetcher.get_json(url))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def find(self, canvas_id):
+        """Return the position of the canvas with the given id."""
+        return self._byid[canvas_id]
+
+    def image_url(
+        self,
+        index,
+        region=None,
+        size="max",
+        rotation=0,
+        quality="default",
+        fmt="jpg",
+        choice=0,
+    ):
+        """Build the URL of the image of a canvas.
+
+        Args:
+            index (int): The canvas.
+            region (str, optional): The region parameter. Defaults to the
+            region of the ImageApiSelector of the canvas or "full".
+            size (str, optional): Defaults to "max".
+            rotation (int, optional): Defaults to 0.
+            quality (str, optional): Defaults to "default".
+            fmt (str, optional): Defaults to "jpg".
+            choice (int, optional): The layer of a Choice. Defaults to 0.
+
+        Returns:
+            str: The URL, or the id of the image if it has no image service.
+        """
+        record = self.records[index]
+        if not record.layers:
+            return None
+        layer = record.layer(choice)
+        if layer.service_id is None:
+            return layer.image_id
+        if region is None:
+            region = record.selector_region or "full"
+        return region_url(layer.service_id, region, size, rotation, quality, fmt)
+
+    def choice_urls(self, index, region=None, size="max", **kwargs):
+        """Return the URLs of all the layers of a canvas (e.g. the bands of a
+        multispectral Choice), see image_url for the arguments."""
+        return [
+            self.image_url(index, region, size, choice=i, **kwargs)
+            for i in range(len(self.records[index].layers))
+        ]
@@ -0,0 +1,194 @@
+"""
+Timing of the stages of loading a canvas (download, decoding, drawing,
+annotations, widgets) and counters of the cache hits and misses. The events
+can be observed with callbacks, summarised in a table and written as a trace
+file readable by chrome://tracing or https://ui.perfetto.dev. When disabled
+the profiler only costs a function call per stage.
+"""
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    def __init__(self, enabled=False, max_events=100000):
+        """Collect the duration of named stages and counters.
+
+        Args:
+            enabled (bool, optional): Record the events. Defaults to False.
+            max_events (int, optional): Events kept for the trace, the oldest
+            are dropped (the statistics still include them). Defaults to
+            100000.
+        """
+        self.enabled = enabled
+        self.events = deque(maxlen=max_events)
+        self.counters = {}
+        self._stages = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def subscribe(self, callback):
+        """Call a function with every event recorded.
+
+        The callback receives a dict with name, start and duration (seconds)
+        and the fields of the stage. It runs in the thread that recorded the
+        event, which can be a download thread.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def record(self, name, start, end=None, **fields):
+        """Record a stage timed by the caller with time.perf_counter()."""
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.perf_counter()
+        context = getattr(self._local, "context", None)
+        if context is not None:
+            fields = dict(context[0], **fields)
+            totals = context[1]
+            totals[name] = totals.get(name, 0) + fields.get("bytes", 0)
+        event = dict(
+            fields, name=name, start=start - self._origin, duration=end - start
+        )
+        event["thread"] = threading.get_ident()
+        with self._lock:
+            self.events.append(event)
+            stage = self._stages.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0}
+            )
+            stage["count"] += 1
+            stage["total"] += event["duration"]
+            stage["max"] = max(stage["max"], event["duration"])
+            stage["bytes"] += fields.get("bytes", 0)
+        for callback in self._subscribers:
+            callback(event)
+
+    def stage(self, name, **fields):
+        """Time a block of code.
+
+        Example:
+            with profiler.stage("fetch", url=url) as fields:
+                data = download(url)
+                fields["bytes"] = len(data)
+
+        Args:
+            name (str): The name of the stage.
+            **fields: Stored with the event (e.g. canvas, url, bytes). More
+            can be added to the dict returned while the block runs.
+        """
+        if not self.enabled:
+            return nullcontext(fields)
+        return self._timed(name, fields)
+
+    @contextmanager
+    def _timed(self, name, fields):
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(name, start, **fields)
+
+    def context(self, **fields):
+        """Add fields to the events recorded by this thread in a block.
+
+        Example:
+            with profiler.context(canvas=3) as loaded:
+                img = fetcher.imread(url)  # the fetch event has canvas=3
+            print(loaded.get("fetch", 0))
+
+        Returns:
+            dict: The bytes of those events summed by stage name.
+        """
+        if not self.enabled:
+            return nullcontext({})
+        return self._context(fields)
+
+    @contextmanager
+    def _context(self, fields):
+        totals = {}
+        previous = getattr(self._local, "context", None)
+        self._local.context = (fields, totals)
+        try:
+            yield totals
+        finally:
+            self._local.context = previous
+
+    def count(self, name, n=1):
+        """Increase a counter (e.g. cache hits)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def stats(self):
+        """Return, for every stage, the count, the total and maximum duration
+        in seconds and the bytes, and the counters."""
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self._stages.items()}
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def html(self):
+        """The statistics as a HTML table."""
+        stats = self.stats()
+        rows = [
+            "<tr><th>Stage</th><th>Count</th><th>Total (s)</th><th>Mean (ms)</th>"
+            "<th>Max (ms)</th><th>MiB</th></tr>"
+        ]
+        for name, stage in sorted(stats["stages"].items()):
+            mean = stage["total"] / stage["count"] * 1000
+            rows.append(
+                f"<tr><td>{name}</td><td>{stage['count']}</td>"
+                f"<td>{stage['total']:.3f}</td><td>{mean:.1f}</td>"
+                f"<td>{stage['max'] * 1000:.1f}</td>"
+                f"<td>{stage['bytes'] / 2**20:.2f}</td></tr>"
+            )
+        for name, value in sorted(stats["counters"].items()):
+            rows.append(f"<tr><td>{name}</td><td>{value}</td></tr>")
+        return "<table>" + "".join(rows) + "</table>"
+
+    def dump(self, path):
+        """Write the events in the Chrome trace event format.
+
+        Args:
+            path (str): The JSON file, which can be opened with
+            chrome://tracing or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        trace = []
+        for event in events:
+            args = {
+                k: v
+                for k, v in event.items()
+                if k not in ("name", "start", "duration", "thread")
+            }
+            trace.append(
+                {
+                    "name": event["name"],
+                    "cat": "iiifnotebook",
+                    "ph": "X",
+                    "ts": event["start"] * 1e6,
+                    "dur": event["duration"] * 1e6,
+                    "pid": pid,
+                    "tid": event["thread"],
+                    "args": args,
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "otherData": counters}, f)
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.counters.clear()
+            self._stages.clear()
@@ -0,0 +1,165 @@
+"""
+Bookkeeping of the images drawn on the axes. Besides the base image of the
+canvas, zoom, tile and refinement layers are drawn on top of it; without a
+limit they would accumulate in memory and slow down every redraw.
+"""
+import threading
+
+import numpy as np
+
+
+class Layer:
+    __slots__ = ("kind", "artist", "extent")
+
+    def __init__(self, kind, artist, extent):
+        self.kind = kind
+        self.artist = artist
+        self.extent = extent
+
+    @property
+    def nbytes(self):
+        return self.artist.get_array().nbytes
+
+    @property
+    def bounds(self):
+        """The extent as (xmin, xmax, ymin, ymax)."""
+        left, right, bottom, top = self.extent
+        return min(left, right), max(left, right), min(bottom, top), max(bottom, top)
+
+    def within(self, bounds):
+        xmin, xmax, ymin, ymax = self.bounds
+        return (
+            xmin >= bounds[0]
+            and xmax <= bounds[1]
+            and ymin >= bounds[2]
+            and ymax <= bounds[3]
+        )
+
+    def intersects(self, bounds):
+        xmin, xmax, ymin, ymax = self.bounds
+        return (
+            xmin < bounds[1]
+            and xmax > bounds[0]
+            and ymin < bounds[3]
+            and ymax > bounds[2]
+        )
+
+
+class LayerManager:
+    def __init__(self, ax, max_bytes=512 * 2**20, pool_size=4):
+        """Track the images drawn over the canvas and bound their memory.
+
+        Args:
+            ax (matplotlib.axes.Axes): The axes of the viewer.
+            max_bytes (int, optional): Memory budget of the decoded images of
+            the layers. When exceeded the layers outside the view are removed
+            first, then the oldest ones. Defaults to 512 MiB.
+            pool_size (int, optional): Number of source arrays kept for being
+            reused as buffers (imshow keeps its own copy of the data).
+            Defaults to 4.
+        """
+        self.ax = ax
+        self.max_bytes = max_bytes
+        self.pool_size = pool_size
+        self.base = None
+        self.layers = []
+        self._pool = []
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self):
+        total = sum(layer.nbytes for layer in self.layers)
+        if self.base is not None:
+            total += self.base.get_array().nbytes
+        return total
+
+    def set_base(self, artist):
+        """Register the image of the whole canvas, which is never evicted."""
+        self.base = artist
+
+    def _viewbounds(self):
+        x1, x2 = self.ax.get_xlim()
+        y1, y2 = self.ax.get_ylim()
+        return min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+
+    def add(self, kind, img, extent, replace=False, **kwargs):
+        """Draw an image over the canvas keeping the current view.
+
+        Matplotlib stores a copy of the data, so after drawing img is
+        recycled as a buffer (see buffer) and must not be used anymore.
+
+        Args:
+            kind (str): The kind of layer, e.g. "zoom", "tile" or "refine".
+            img (numpy.ndarray): The image.
+            extent (tuple): The extent in canvas coordinates, as for imshow.
+            replace (bool, optional): If True the other layers of the same
+            kind are removed. Defaults to False.
+            **kwargs: Passed to imshow.
+
+        Returns:
+            matplotlib.image.AxesImage: The drawn image.
+        """
+        if replace:
+            self.remove(kind)
+        new = Layer(kind, None, extent)
+        # the layers hidden below the new one are not needed anymore
+        for layer in list(self.layers):
+            if layer.within(new.bounds):
+                self._remove(layer)
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+        new.artist = self.ax.imshow(img, extent=extent, **kwargs)
+        # imshow autoscales, we keep the view without firing the events
+        self.ax.set_xlim(xlim, emit=False)
+        self.ax.set_ylim(ylim, emit=False)
+        self.layers.append(new)
+        self._recycle(img)
+        self._evict(keep=new)
+        return new.artist
+
+    def _evict(self, keep):
+        view = self._viewbounds()
+        offscreen = [layer for layer in self.layers if not layer.intersects(view)]
+        candidates = offscreen + [l for l in self.layers if l not in offscreen]
+        total = self.total_bytes
+        for layer in candidates:
+            if total <= self.max_bytes:
+                break
+            if layer is keep:
+                continue
+            total -= layer.nbytes
+            self._remove(layer)
+
+    def _remove(self, layer):
+        self.layers.remove(layer)
+        layer.artist.remove()
+
+    def _recycle(self, array):
+        if type(array) is np.ndarray and array.flags.owndata:
+            with self._lock:
+                self._pool.append(array)
+                del self._pool[: -self.pool_size]
+
+    def remove(self, kind=None):
+        """Remove the layers of a kind, or all but the base if kind is None."""
+        for layer in list(self.layers):
+            if kind is None or layer.kind == kind:
+                self._remove(layer)
+
+    def buffer(self, shape, dtype):
+        """Return a zeroed array, reusing a recycled one when the shape and
+        dtype match. It can be called from worker threads."""
+        dtype = np.dtype(dtype)
+        with self._lock:
+            for i, array in enumerate(self._pool):
+                if array.shape == tuple(shape) and array.dtype == dtype:
+                    array = self._pool.pop(i)
+                    array.fill(0)
+                    return array
+        return np.zeros(shape, dtype=dtype)
+
+    def clear(self):
+        """Forget every layer, e.g. after the axes images have been removed."""
+        self.layers = []
+        self.base = None
+        with self._lock:
+            self._pool.clear()
@@ -0,0 +1,277 @@
+"""
+A numpy-like view of a IIIF image service. Slicing the view requests only the
+regions needed, in chunks that are cached, so image analysis can work on huge
+scans without downloading them at full size.
+"""
+from collections import OrderedDict
+import math
+import threading
+
+import numpy as np
+
+from .imageservice import region_url
+
+
+class ChunkCache:
+    def __init__(self, max_chunks=64):
+        """LRU store of the decoded chunks shared by the views of an image."""
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+                return self._chunks[key]
+        return None
+
+    def put(self, key, chunk):
+        with self._lock:
+            self._chunks[key] = chunk
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+
+
+def _indices(key, length):
+    """Return (start, stop, step, reverse, squeeze) of an index on an axis,
+    with a positive step."""
+    if isinstance(key, (int, np.integer)):
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError(f"index {key} is out of bounds for size {length}")
+        return key, key + 1, 1, False, True
+    if not isinstance(key, slice):
+        raise TypeError("Only integers and slices are supported.")
+    start, stop, step = key.indices(length)
+    if step > 0:
+        return start, max(start, stop), step, False, False
+    # negative steps: the same elements in ascending order, then reversed
+    indices = range(start, stop, step)
+    if len(indices) == 0:
+        return 0, 0, 1, False, False
+    return indices[-1], indices[0] + 1, -step, True, False
+
+
+class IIIFArray:
+    def __init__(
+        self,
+        fetcher,
+        service_url,
+        width,
+        height,
+        scale=1,
+        chunk=1024,
+        quality="default",
+        fmt="jpg",
+        chunks=None,
+    ):
+        """A lazy array (rows, columns, channels) over an image service.
+
+        Indexing with slices, e.g. arr[1000:2000, 500:900], downloads only the
+        chunks of the image that intersect the slices. Strides are turned in
+        smaller sizes requested to the server (arr[::4, ::4] is read from the
+        image scaled by 4, so the server resamples instead of picking pixels).
+
+        Args:
+            fetcher (Fetcher): Used for downloading the chunks.
+            service_url (str): The id of the image service.
+            width (int): Width of the full image.
+            height (int): Height of the full image.
+            scale (int, optional): Downscaling factor of the view. Defaults
+            to 1.
+            chunk (int, optional): Side of the chunks requested (in pixels of
+            the view). Defaults to 1024.
+            quality (str, optional): Defaults to "default".
+            fmt (str, optional): Defaults to "jpg".
+            chunks (ChunkCache, optional): Cache of the decoded chunks.
+            Defaults to a new cache.
+        """
+        self.fetcher = fetcher
+        self.service_url = service_url
+        self.width = int(width)
+        self.height = int(height)
+        self.scale = int(scale)
+        self.chunk = int(chunk)
+        self.quality = quality
+        self.fmt = fmt
+        self.chunks = chunks if chunks is not None else ChunkCache()
+        self._sample = None
+
+    def at_scale(self, factor):
+        """Return a view of the image downscaled by an integer factor.
+
+        The chunks already downloaded are shared with this view.
+        """
+        return IIIFArray(
+            self.fetcher,
+            self.service_url,
+            self.width,
+            self.height,
+            self.scale * int(factor),
+            self.chunk,
+            self.quality,
+            self.fmt,
+            self.chunks,
+        )
+
+    def _probe(self):
+        if self._sample is None:
+            url = region_url(self.service_url, "full", "8,", 0, self.quality, self.fmt)
+            self._sample = self.fetcher.imread(url)
+        return self._sample
+
+    @property
+    def dtype(self):
+        return self._probe().dtype
+
+    @property
+    def shape(self):
+        shape = (
+            math.ceil(self.height / self.scale),
+            math.ceil(self.width / self.scale),
+        )
+        sample = self._probe()
+        if sample.ndim == 3:
+            shape += (sample.shape[2],)
+        return shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        rows = math.ceil(self.height / self.scale)
+        cols = math.ceil(self.width / self.scale)
+        return f"IIIFArray({self.service_url}, rows={rows}, cols={cols}, scale={self.scale})"
+
+    def _chunkurl(self, row, col):
+        rows, cols = self.shape[:2]
+        x = col * self.chunk * self.scale
+        y = row * self.chunk * self.scale
+        w = min(self.chunk * self.scale, self.width - x)
+        h = min(self.chunk * self.scale, self.height - y)
+        size = (
+            min(self.chunk, cols - col * self.chunk),
+            min(self.chunk, rows - row * self.chunk),
+        )
+        url = region_url(
+            self.service_url,
+            f"{x},{y},{w},{h}",
+            f"{size[0]},{size[1]}",
+            0,
+            self.quality,
+            self.fmt,
+        )
+        return url, size
+
+    def _fit(self, img, size):
+        # the server can round the size differently: crop or pad the border
+        width, height = size
+        img = img[:height, :width]
+        if img.shape[0] < height or img.shape[1] < width:
+            pad = [(0, height - img.shape[0]), (0, width - img.shape[1])]
+            pad += [(0, 0)] * (img.ndim - 2)
+            img = np.pad(img, pad, mode="edge")
+        return img
+
+    def _read(self, y0, y1, x0, x1):
+        """Read the rectangle [y0:y1, x0:x1] of the view from the chunks."""
+        sample = self._probe()
+        shape = (y1 - y0, x1 - x0) + sample.shape[2:]
+        out = np.empty(shape, dtype=sample.dtype)
+        if out.size == 0:
+            return out
+        keys = [
+            (row, col)
+            for row in range(y0 // self.chunk, (y1 - 1) // self.chunk + 1)
+            for col in range(x0 // self.chunk, (x1 - 1) // self.chunk + 1)
+        ]
+
+        def copy(row, col, chunk):
+            cy, cx = row * self.chunk, col * self.chunk
+            sy0, sy1 = max(y0, cy), min(y1, cy + chunk.shape[0])
+            sx0, sx1 = max(x0, cx), min(x1, cx + chunk.shape[1])
+            out[sy0 - y0 : sy1 - y0, sx0 - x0 : sx1 - x0] = chunk[
+                sy0 - cy : sy1 - cy, sx0 - cx : sx1 - cx
+            ]
+
+        missing = []
+        for row, col in keys:
+            chunk = self.chunks.get(self._key(row, col))
+            if chunk is None:
+                missing.append((row, col))
+            else:
+                copy(row, col, chunk)
+        if missing:
+            # copied before caching: a read larger than the cache would
+            # otherwise evict its own chunks before using them
+            requests = [self._chunkurl(*k) for k in missing]
+            images = self.fetcher.imread_many([url for url, _ in requests])
+            for (row, col), (_, size), img in zip(missing, requests, images):
+                chunk = self._fit(img, size)
+                copy(row, col, chunk)
+                self.chunks.put(self._key(row, col), chunk)
+        return out
+
+    def _key(self, row, col):
+        return (
+            self.service_url,
+            self.quality,
+            self.fmt,
+            self.scale,
+            self.chunk,
+            row,
+            col,
+        )
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            raise TypeError("Ellipsis is not supported.")
+        key = key + (slice(None),) * (2 - len(key[:2]))
+        rows, cols = self.shape[:2]
+        ystart, ystop, ystep, yrev, ysqueeze = _indices(key[0], rows)
+        xstart, xstop, xstep, xrev, xsqueeze = _indices(key[1], cols)
+        # both strides are multiples of the scale of the view read
+        common = math.gcd(ystep, xstep)
+        if common > 1:
+            # the stride is requested to the server as a smaller size
+            view = self.at_scale(common)
+            vrows, vcols = view.shape[:2]
+            data = view._read(
+                ystart // common,
+                min(vrows, math.ceil(ystop / common)),
+                xstart // common,
+                min(vcols, math.ceil(xstop / common)),
+            )
+            data = data[:: ystep // common, :: xstep // common]
+            data = data[
+                : len(range(ystart, ystop, ystep)), : len(range(xstart, xstop, xstep))
+            ]
+        else:
+            data = self._read(ystart, ystop, xstart, xstop)[::ystep, ::xstep]
+        if yrev:
+            data = data[::-1]
+        if xrev:
+            data = data[:, ::-1]
+        if ysqueeze and xsqueeze:
+            data = data[0, 0]
+        elif ysqueeze:
+            data = data[0]
+        elif xsqueeze:
+            data = data[:, 0]
+        if len(key) > 2:
+            data = data[(Ellipsis,) + key[2:]]
+        return data
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:, :]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
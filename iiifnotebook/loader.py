@@ -0,0 +1,163 @@
+"""
+Loading of resources outside the thread of the widgets. Only the most recent
+request is delivered: when a new one arrives the previous one is cancelled,
+so that scrolling through the canvases downloads and draws only the canvas
+finally selected.
+"""
+import asyncio
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from logging import warning
+import threading
+
+from .fetcher import DownloadCancelled
+
+
+class LatestLoader:
+    def __init__(self, fetcher):
+        """Run downloads in background keeping only the latest request.
+
+        Args:
+            fetcher (Fetcher): Used by the requests for downloading.
+        """
+        self.fetcher = fetcher
+        # not the pool of the fetcher: a request waiting there for the
+        # downloads it submits (e.g. the tiles of a refinement) could take
+        # all its workers and never be served
+        self._executor = None
+        self._generation = 0
+        self._future = None
+        self._cancel = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                1, thread_name_prefix="iiifnotebook-loader"
+            )
+        return self._executor
+
+    @property
+    def busy(self):
+        """True while a request is being downloaded."""
+        return self._future is not None and not self._future.done()
+
+    def cancel(self):
+        """Abandon the request in progress, if any."""
+        with self._lock:
+            self._generation += 1
+            self._abandon()
+
+    def _abandon(self):
+        if self._cancel is not None:
+            self._cancel.set()
+        if self._future is not None:
+            self._future.cancel()
+        self._future = None
+        self._cancel = None
+
+    def request(self, fetch, done, partial=None):
+        """Load a resource and deliver it, unless a newer request arrives.
+
+        When called from a running event loop (e.g. a widget callback in the
+        Jupyter kernel) the function returns immediately: fetch runs in the
+        worker pool and done is called back on the event loop. Otherwise
+        both are run synchronously.
+
+        Args:
+            fetch (callable): Receives a threading.Event set when the request
+            is superseded and returns the loaded resource. It runs in a
+            worker thread and must not touch widgets or figures.
+            done (callable): Receives the resource. It runs on the thread of
+            the event loop.
+            partial (callable, optional): If given, fetch also receives an
+            emit function for delivering intermediate results (e.g. a
+            thumbnail) that are passed to partial on the thread of the event
+            loop. Defaults to None.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._abandon()
+            cancel = threading.Event()
+            self._cancel = cancel
+            args = (cancel,)
+            if partial is not None:
+                args += (self._emitter(loop, generation, partial),)
+            if loop is not None:
+                future = self._future = self.executor.submit(fetch, *args)
+        if loop is None:
+            done(fetch(*args))
+            return
+        future.add_done_callback(
+            lambda f: loop.call_soon_threadsafe(self._deliver, generation, f, done)
+        )
+
+    def close(self):
+        """Cancel the request in progress and stop the thread."""
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _emitter(self, loop, generation, partial):
+        def emit(result):
+            if loop is None:
+                partial(result)
+            else:
+                loop.call_soon_threadsafe(
+                    self._deliverpartial, generation, result, partial
+                )
+
+        return emit
+
+    def _deliverpartial(self, generation, result, partial):
+        if generation == self._generation:
+            partial(result)
+
+    def _deliver(self, generation, future, done):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._future = None
+            self._cancel = None
+        try:
+            result = future.result()
+        except (CancelledError, DownloadCancelled):
+            return
+        except Exception as e:
+            warning(f"Could not load the resource: {e}")
+            return
+        done(result)
+
+
+class Debouncer:
+    def __init__(self, delay, fn):
+        """Call a function only once a burst of events has settled.
+
+        Args:
+            delay (float): Seconds without new calls before fn is called.
+            fn (callable): Called with the arguments of the last call.
+        """
+        self.delay = delay
+        self.fn = fn
+        self._handle = None
+
+    def __call__(self, *args):
+        self.cancel()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (e.g. a script): nothing to wait for
+            self.fn(*args)
+            return
+        self._handle = loop.call_later(self.delay, self.fn, *args)
+
+    def cancel(self):
+        """Drop the pending call, if any."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
@@ -6,29 +6,83 @@ from logging import warning
 from IPython.display import display
 import ipywidgets as widgets
 
-from skimage import io
-
 from matplotlib.widgets import RectangleSelector
-import matplotlib.patches as patches
 import matplotlib.pyplot as plt
 import matplotlib
 
-import numpy as np
-import requests
 from io import StringIO
 from html.parser import HTMLParser
-import psutil
+import time
 
 from collections import defaultdict
-
-global RUNNING_IN_JUPYTER
-RUNNING_IN_JUPYTER = any(
-    [i.endswith("bin/jupyter-notebook") for i in psutil.Process().parent().cmdline()]
+from functools import lru_cache
+
+from .collection import Collection
+from .core import IIIFcore
+from .geometry import (
+    boxes_to_pct,
+    format_region,
+    pct_to_boxes,
+    region_box,
+    rescale_boxes,
+    rotate_boxes,
 )
-
-
-class IIIFviewer:
-    def __init__(self, url, preferred_language="en"):
+from .imageservice import fetch_region_tiles, negotiate_size, region_url
+from .layers import LayerManager
+from .loader import Debouncer, LatestLoader
+from .overlay import AnnotationOverlay
+from .pagedlist import CollectionBrowser, PagedHTML
+from .prefetch import Prefetcher
+from .rois import iter_rois
+from .spatial import AnnotationIndex
+from . import utils
+
+
+def _canvas_extent(box, image_size, canvas_size):
+    """The imshow extent on the canvas of a box in pixels of the image."""
+    x, y, w, h = rescale_boxes(box, image_size, canvas_size)
+    return (x - 0.5, x + w - 0.5, y + h - 0.5, y - 0.5)
+
+
+@lru_cache(maxsize=None)
+def running_in_jupyter():
+    """True if the parent process is a Jupyter notebook server."""
+    import psutil
+
+    return any(
+        [
+            i.endswith("bin/jupyter-notebook")
+            for i in psutil.Process().parent().cmdline()
+        ]
+    )
+
+
+def __getattr__(name):
+    # RUNNING_IN_JUPYTER was computed when importing the module, it is kept
+    # for compatibility and computed when first read
+    if name == "RUNNING_IN_JUPYTER":
+        return running_in_jupyter()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class IIIFviewer(IIIFcore):
+    def __init__(
+        self,
+        url,
+        preferred_language="en",
+        workers=8,
+        max_per_host=6,
+        cache_dir=None,
+        cache_size=2**30,
+        prefetch=0,
+        prefetch_memory=256 * 2**20,
+        layer_memory=512 * 2**20,
+        progressive=True,
+        select=None,
+        manifest_index=None,
+        pack=None,
+        profile=False,
+    ):
         """An embedded image viewer can read IIIF manifest compliant with
         presentation API v.3.
 
@@ -36,26 +90,84 @@ class IIIFviewer:
             url (str): The url of the manifest
             preferred_language (str, optional): The preferred language of the
             manifest if available. Defaults to 'en'.
+            workers (int, optional): Number of threads used for downloading
+            images concurrently. Defaults to 8.
+            max_per_host (int, optional): Maximum number of connections open
+            to the same server. Defaults to 6.
+            cache_dir (str, optional): Folder where manifests and images are
+            cached between sessions. If None nothing is cached. Defaults to
+            None.
+            cache_size (int, optional): Size budget in bytes of the cache,
+            the least recently used responses are evicted. Defaults to 1 GiB.
+            prefetch (int, optional): Number of canvases before and after the
+            one shown that are downloaded in background. Defaults to 0 (no
+            prefetching).
+            prefetch_memory (int, optional): Memory budget in bytes of the
+            prefetched images. Defaults to 256 MiB.
+            layer_memory (int, optional): Memory budget in bytes of the zoom,
+            tile and refinement images drawn over the canvas. Defaults to
+            512 MiB.
+            progressive (bool, optional): When changing canvas show first a
+            thumbnail while the preview is downloaded. Defaults to True.
+            select (int, str or list, optional): When the url is a Collection,
+            the index or id of the manifest to open, or a list of them for
+            nested collections. If None the manifest is asked on the console.
+            Defaults to None.
+            manifest_index (ManifestIndex or str, optional): A local index
+            built with crawler.crawl (or the path of its database). Manifests
+            and collections found there are not downloaded. Defaults to None.
+            pack (Pack or str, optional): An offline pack written by
+            export_pack, read instead of the server. The url can be None for
+            opening the manifest of the pack. Defaults to None.
+            profile (bool, optional): Time the stages of every canvas load
+            (fetch, decode, imshow, annotations, widgets), count the cache
+            hits in the profiler attribute and show them in a Stats tab.
+            The events can be written with profiler.dump(path). Defaults to
+            False.
         """
-        self.url = url
-        self.preferred_language = preferred_language
-        self.manifest = None
+        IIIFcore.__init__(
+            self,
+            url,
+            preferred_language=preferred_language,
+            workers=workers,
+            max_per_host=max_per_host,
+            cache_dir=cache_dir,
+            cache_size=cache_size,
+            select=select,
+            manifest_index=manifest_index,
+            pack=pack,
+            profile=profile,
+            load=False,
+        )
+        self._canvasloader = LatestLoader(self.fetcher)
+        self._refineloader = LatestLoader(self.fetcher)
+        self.prefetcher = None
+        if prefetch > 0:
+            self.prefetcher = Prefetcher(
+                self.fetcher,
+                self._canvasURLs,
+                depth=prefetch,
+                max_bytes=prefetch_memory,
+            )
+        self.annotationpages.prefetcher = self.prefetcher
+        self._annotationloader = LatestLoader(self.fetcher)
         self.service_url = None
         self._canvas_info_items = []
         self._canvas_info_labels = []
         self.canvas_info = widgets.Accordion()
         self._cavnas_info_html = widgets.HTML("None")
         self._canvasMetadataTable = widgets.HTML("None")
-        self._annotations_html = widgets.HTML("None")
+        self._annotations_list = PagedHTML()
         self.contentresource_info = widgets.Accordion()
         self._ccontentresource_info_html = widgets.HTML("None")
-        self._contentresource_annotations_html = widgets.HTML("")
+        self._contentresource_annotations_list = PagedHTML(empty="")
         self._lcnv_width = None
         self._lcnv_height = None
         self._limgwidth = None
         self._limgheight = None
         self._lannotations_count = 0
         self._tab_nest = None
+        self._stats_html = None
         self.lastRoI = None
         self.lastRoIURL = None
         self.RoIs = defaultdict(list)
@@ -66,6 +178,15 @@ class IIIFviewer:
         self.region_height = None
         self.image = None
         self._imagePlotted = False
+        self.layer_memory = layer_memory
+        self.progressive = progressive
+        # size of the thumbnail requested when the canvas does not have one
+        self.thumbnail_size = 96
+        self.layers = None
+        self.annotations = None
+        self._refinedview = None
+        # seconds the view must stay still before it is refined
+        self.refine_delay = 0.3
         # Must be the last
         self.openData()
 
@@ -77,6 +198,8 @@ class IIIFviewer:
             will be use the region written on the control widget. Defaults to None.
             preview (bool, optional): If True the image return will have the size
             specified on the preview widget of the controls panel. Defaults to False.
+            If the size is "auto" it is chosen from the size of the axes and
+            the sizes advertised by the image service.
 
         Raises:
             ValueError: _description_
@@ -95,25 +218,20 @@ class IIIFviewer:
             size = self.W_final_size.value
 
         # TODO: save region parameters
-        if region.startswith("pct:"):
-            print("Not implemented")
-            regionSplitted = region.strip("pct:")
-            xi, yi, wi, hi = map(float, regionSplitted.split(","))
-            self.region_x = xi / 100 * self._lcnv_width
-            self.region_y = yi / 100 * self._lcnv_height
-            self.region_width = wi / 100 * self._lcnv_width
-            self.region_height = hi / 100 * self._lcnv_height
-        elif "," in region:
-            xi, yi, wi, hi = map(float, region.split(","))
-            self.region_x = xi
-            self.region_y = yi
-            self.region_width = wi
-            self.region_height = hi
+        if "," in region:
+            (
+                self.region_x,
+                self.region_y,
+                self.region_width,
+                self.region_height,
+            ) = region_box(region, self._lcnv_width, self._lcnv_height)
         else:
             self.region_x = None
             self.region_y = None
             self.region_width = None
             self.region_height = None
+        if size == "auto":
+            size = self._autoSize(region)
         return "/".join(
             [
                 self.service_url,
@@ -124,6 +242,270 @@ class IIIFviewer:
             ]
         )
 
+    def get_currentImage(self, region=None, preview=False):
+        """Return the image shown on the visualizer as a numpy array.
+
+        The image is read from the cache when the same URL was already
+        downloaded.
+
+        Args:
+            region (str, optional): See get_currentImageURL. Defaults to None.
+            preview (bool, optional): See get_currentImageURL. Defaults to False.
+
+        Returns:
+            numpy.ndarray: The image.
+        """
+        return self.fetcher.imread(
+            self.get_currentImageURL(region=region, preview=preview)
+        )
+
+    def get_RoI(self, canvasIndex=None, ROIindex=0):
+        """Return the pixels of a saved RoI as a numpy array.
+
+        Args:
+            canvasIndex (int, optional): The canvas of the RoI. Defaults to the
+            canvas shown.
+            ROIindex (int, optional): The index of the RoI. Defaults to 0.
+
+        Returns:
+            numpy.ndarray: The image of the region of interest.
+        """
+        return self.fetcher.imread(self.get_RoIURL(canvasIndex, ROIindex))
+
+    def iter_RoIs(self, canvases=None, preview=False, out_dir=None, threshold=0.7):
+        """Download the saved RoIs of many canvases concurrently, yielding them
+        as they arrive.
+
+        RoIs of the same canvas that overlap heavily are downloaded with one
+        request of the region enclosing them and cropped locally.
+
+        Args:
+            canvases (list, optional): The canvases. Defaults to all the
+            canvases with RoIs.
+            preview (bool, optional): Use the preview size instead of the final
+            size. Defaults to False.
+            out_dir (str, optional): A folder where each RoI is saved as .npy
+            as soon as it is downloaded, described in rois.jsonl. Defaults to
+            None.
+            threshold (float, optional): How much of the enclosing region the
+            RoIs must cover for being merged (1 merges only contained RoIs).
+            Defaults to 0.7.
+
+        Yields:
+            RoIResult: The canvas, index, comment, coordinates and pixels of
+            each RoI.
+        """
+        if canvases is None:
+            canvases = [c for c in self.RoIs if self.RoIs[c]]
+        size = self.W_preview_size.value if preview else self.W_final_size.value
+        if size == "auto":
+            # the RoIs are cropped from the enclosing regions at the same scale
+            size = "max"
+        return iter_rois(
+            self.fetcher,
+            self.canvas_index,
+            {c: self.RoIs[c] for c in canvases},
+            size=size,
+            quality=self.W_quality.value,
+            fmt=self.W_img_format.value,
+            threshold=threshold,
+            out_dir=out_dir,
+        )
+
+    def get_RoIs(self, canvases=None, preview=False, out_dir=None, threshold=0.7):
+        """Return all the saved RoIs, see iter_RoIs for the arguments.
+
+        Returns:
+            tuple: The lists of images, comments and coordinates (canvas,
+            RoI index, percentages), ordered by canvas and RoI.
+        """
+        results = sorted(
+            self.iter_RoIs(canvases, preview, out_dir, threshold),
+            key=lambda r: (r.canvas, r.index),
+        )
+        images = [r.image for r in results]
+        comments = [r.comment for r in results]
+        coordinates = [(r.canvas, r.index, r.pct) for r in results]
+        return images, comments, coordinates
+
+    def get_annotationsIn(self, region=None, canvasIndex=None, ROIindex=None):
+        """Return the annotations of a canvas whose target intersects a region.
+
+        Args:
+            region (str, optional): A region of the canvas ("x,y,w,h",
+            "pct:x,y,w,h", ...). Defaults to the whole canvas.
+            canvasIndex (int, optional): Defaults to the canvas shown.
+            ROIindex (int, optional): Use a saved RoI of the canvas as region.
+            Defaults to None.
+
+        Returns:
+            list: The annotations.
+        """
+        if canvasIndex is None:
+            canvasIndex = self.W_canvasID.value
+        record = self.canvas_index[canvasIndex]
+        if ROIindex is not None:
+            box = pct_to_boxes(
+                self.RoIs[canvasIndex][ROIindex][0], record.width, record.height
+            )
+        else:
+            box = region_box(region or "full", record.width, record.height)
+        if canvasIndex == self.W_canvasID.value:
+            # already indexed for drawing
+            index = self.annotations.index
+        else:
+            items = [
+                item for page in record.annotation_pages for item in page["items"]
+            ]
+            items += self.annotationpages.items(record.annotation_refs)
+            index = AnnotationIndex(items, record.width, record.height)
+        return index.within(box)
+
+    @staticmethod
+    def browseCollection(url, page_size=50, **kwargs):
+        """Show a paged and searchable list of the manifests of a collection,
+        opening a viewer for the manifest chosen.
+
+        Args:
+            url (str): The url of the collection.
+            page_size (int, optional): Items per page. Defaults to 50.
+            **kwargs: Passed to IIIFviewer.
+
+        Returns:
+            CollectionBrowser: The browser, whose viewers are in its viewers
+            attribute.
+        """
+        collection = Collection.from_url(
+            url, preferred_language=kwargs.get("preferred_language", "en")
+        )
+
+        def on_open(item):
+            browser.viewers.append(IIIFviewer(item.id, **kwargs))
+
+        browser = CollectionBrowser(collection, on_open, page_size)
+        browser.viewers = []
+        display(browser.widget)
+        return browser
+
+    def get_imageInfo(self, service_url=None):
+        """Return the info.json of an image service.
+
+        Args:
+            service_url (str, optional): The id of the image service. Defaults
+            to the service of the image shown.
+
+        Returns:
+            ImageInfo: The parsed info.json.
+        """
+        if service_url is None:
+            service_url = self.service_url
+        return IIIFcore.get_imageInfo(self, service_url)
+
+    def _autoSize(self, region, service_url=None):
+        """Size parameter with enough pixels for the axes, see negotiate_size."""
+        try:
+            info = self.get_imageInfo(service_url)
+        except (OSError, ValueError, KeyError):
+            return "max"
+        bbox = self.ax.get_window_extent()
+        # the pixels of the axes before the server rotates the image
+        width, height = rotate_boxes(
+            (0, 0, bbox.width, bbox.height),
+            bbox.width,
+            bbox.height,
+            -self.W_rot_fld.value,
+        )[0, 2:]
+        return negotiate_size(info, region, width, height)
+
+    def _canvasURLs(self, canvasIndex, preview=True):
+        """Return the URLs of the images shown for a canvas and of the
+        annotation pages it references without embedding them."""
+        record = self.canvas_index[canvasIndex]
+        region = record.selector_region or self.W_region.value
+        size = self.W_preview_size.value if preview else self.W_final_size.value
+        if size == "auto" and record.layers:
+            layer = record.layer(self.W_choiceelem.value)
+            size = self._autoSize(region, layer.service_id)
+        url = self.canvas_index.image_url(
+            canvasIndex,
+            region=region,
+            size=size,
+            rotation=self.W_rot_fld.value,
+            quality=self.W_quality.value,
+            fmt=self.W_img_format.value,
+            choice=self.W_choiceelem.value,
+        )
+        images = [url] if url is not None else []
+        pages = [
+            url for url in record.annotation_refs if url not in self.annotationpages
+        ]
+        return images, pages
+
+    def _thumbnailURL(self, canvasIndex):
+        """URL of a small image of a canvas shown while the preview loads."""
+        record = self.canvas_index[canvasIndex]
+        if record.thumbnail is not None:
+            return record.thumbnail
+        if not record.layers:
+            return None
+        layer = record.layer(self.W_choiceelem.value)
+        if layer.service_id is None:
+            return None
+        size = f"!{self.thumbnail_size},{self.thumbnail_size}"
+        return region_url(
+            layer.service_id,
+            record.selector_region or self.W_region.value,
+            size,
+            self.W_rot_fld.value,
+            self.W_quality.value,
+            self.W_img_format.value,
+        )
+
+    def _isLocal(self, url):
+        """True if the image can be read without waiting for the network."""
+        if self.prefetcher is not None and self.prefetcher.has_image(url):
+            return True
+        return self.fetcher.is_cached(url)
+
+    def _readImage(self, url, cancel=None):
+        """Read an image, from the prefetched ones if available."""
+        if self.prefetcher is not None:
+            img = self.prefetcher.get_image(url, cancel)
+            if img is not None:
+                self.profiler.count("prefetch.hit")
+                return img
+        return self.fetcher.imread(url, cancel=cancel)
+
+    def get_array(self, canvasIndex=None, choice=None, chunk=1024):
+        """Return a lazy numpy-like view of the image of a canvas.
+
+        Slicing it (e.g. arr[1000:2000, 500:900] or arr[::8, ::8]) requests
+        only the needed regions to the image service, in cached chunks.
+        arr.at_scale(f) gives a view downscaled by f.
+
+        Args:
+            canvasIndex (int, optional): Defaults to the canvas shown.
+            choice (int, optional): The layer of a Choice. Defaults to the
+            one selected.
+            chunk (int, optional): Side in pixels of the chunks requested.
+            Defaults to 1024.
+
+        Returns:
+            IIIFArray: The view of the full resolution image.
+        """
+        if canvasIndex is None:
+            canvasIndex = self.W_canvasID.value
+        if choice is None:
+            choice = self.W_choiceelem.value
+        return IIIFcore.get_array(
+            self,
+            canvasIndex,
+            choice,
+            chunk,
+            quality=self.W_quality.value,
+            fmt=self.W_img_format.value,
+        )
+
     def get_RoIURL(self, canvasIndex=None, ROIindex=0):
         """_summary_
 
@@ -138,77 +520,100 @@ class IIIFviewer:
             canvasIndex = self.W_canvasID.value
         if canvasIndex in self.RoIs:
             RoI = self.RoIs[canvasIndex]
-            region = ",".join(map(str, self.RoIs[canvasIndex][ROIindex][0]))
-        return self.get_currentImageURL(region=f"pct:{region}")
+            region = format_region(self.RoIs[canvasIndex][ROIindex][0], pct=True)
+        return self.get_currentImageURL(region=region)
 
-    def get_datafromURLs(self, urls):
-        if isinstance(urls, list):
-            data = np.dstack([io.imread(url) for url in urls])
-        else:
-            data = io.imread(urls)
-        return data
+    def get_stack(
+        self, canvasIndex=None, preview=False, region=None, ROIindex=None, filename=None
+    ):
+        """Return the layers of a canvas (e.g. the bands of a multispectral
+        Choice) stacked in a single array.
 
-    def get_stackfromChoices(self, canvasIndex=None, preview=False):
-        # TODO: make it work for the newer version
+        The array is allocated once and each band is decoded straight into its
+        slice, optionally in a memory mapped file.
+
+        Args:
+            canvasIndex (int, optional): Defaults to the canvas shown.
+            preview (bool, optional): Use the preview size instead of the final
+            size. Defaults to False.
+            region (str, optional): The region parameter. Defaults to the
+            region of the controls panel.
+            ROIindex (int, optional): Use the region of a saved RoI of the
+            canvas instead. Defaults to None.
+            filename (str, optional): A .npy file where the stack is written
+            and memory mapped, for stacks larger than the memory. Defaults to
+            None.
+
+        Returns:
+            tuple: The stack (height, width, channels) and the labels of the
+            layers.
+        """
         if canvasIndex is None:
             canvasIndex = self.W_canvasID.value
-        canvas = self.manifest["items"][canvasIndex]
-        urls = []
-        for cnvitm in canvas["items"]:
-            if cnvitm["type"] == "AnnotationPage":
-                for ann in cnvitm["items"]:
-                    if ann["motivation"] == "painting":
-                        body = ann["body"]
-                        if body["type"] == "Choice":
-                            for choice in body["items"]:
-                                if "service" in choice:
-                                    # TODO: iterate
-                                    baseurl = choice["service"][0]["id"]
-                                    if preview:
-                                        size = self.W_preview_size.value
-                                    else:
-                                        size = self.W_final_size.value
-                                    if canvasIndex in self.RoIs:
-                                        RoI = self.RoIs[canvasIndex]
-                                        region = ",".join(
-                                            map(str, self.RoIs[canvasIndex])
-                                        )
-                                        region = f"pct:{region}"
-                                        url = "/".join(
-                                            [
-                                                baseurl,
-                                                region,
-                                                size,
-                                                str(self.W_rot_fld.value),
-                                                ".".join(
-                                                    [
-                                                        self.W_quality.value,
-                                                        self.W_img_format.value,
-                                                    ]
-                                                ),
-                                            ]
-                                        )
-                                        urls.append(url)
-                                else:
-                                    url = choice["id"]
-                                    urls.append(url)
-        print(urls)
-        return self.get_datafromURLs(urls)
+        record = self.canvas_index[canvasIndex]
+        if ROIindex is not None:
+            RoI = self.RoIs[canvasIndex][ROIindex][0]
+            region = format_region(RoI, pct=True)
+        elif region is None:
+            region = record.selector_region or self.W_region.value
+        if preview:
+            size = self.W_preview_size.value
+        else:
+            size = self.W_final_size.value
+        if size == "auto" and record.layers:
+            # the same size for all the layers, chosen from the first one
+            size = self._autoSize(region, record.layers[0].service_id)
+        return self.get_layers(
+            canvasIndex,
+            region=region,
+            size=size,
+            rotation=self.W_rot_fld.value,
+            quality=self.W_quality.value,
+            fmt=self.W_img_format.value,
+            filename=filename,
+        )
+
+    def get_stackfromChoices(self, canvasIndex=None, preview=False):
+        stack, _ = self.get_stack(canvasIndex, preview=preview)
+        return stack
+
+    def map_canvases(self, func, canvases=None, size=None, region=None, **kwargs):
+        """Apply a function to the images of many canvases in parallel, see
+        IIIFcore.map_canvases.
+
+        The size, region, rotation, quality, format and choice default to the
+        ones of the controls panel (the final size, "max" if it is "auto").
+        """
+        if size is None:
+            size = self.W_final_size.value
+            if size == "auto":
+                size = "max"
+        if region is None and self.W_region.value != "full":
+            region = self.W_region.value
+        kwargs.setdefault("rotation", self.W_rot_fld.value)
+        kwargs.setdefault("quality", self.W_quality.value)
+        kwargs.setdefault("fmt", self.W_img_format.value)
+        kwargs.setdefault("choice", self.W_choiceelem.value)
+        return IIIFcore.map_canvases(self, func, canvases, size, region, **kwargs)
+
+    def close(self):
+        """Stop the background loaders, the worker threads and close the
+        connections."""
+        for loader in (
+            self._canvasloader,
+            self._refineloader,
+            self._annotationloader,
+        ):
+            loader.close()
+        IIIFcore.close(self)
 
     def openData(self, forceReload=False):
-        if not RUNNING_IN_JUPYTER:
+        if not running_in_jupyter():
             warning("The visualizer is designed to work with Jupyter notebook.")
         firstopening = True
 
         def tryLanguage(iiifobject):
-            if self.preferred_language in iiifobject:
-                values = iiifobject[self.preferred_language]
-            elif "none" in iiifobject:
-                values = iiifobject["none"]
-            else:
-                values = list(iiifobject.values())[0]
-                print(f"language {self.preferred_language} not available.")
-            return " ".join(values)
+            return utils.tryLanguage(iiifobject, self.preferred_language)
 
         def saveROIbutton(arg):
             self.RoIs[self.W_canvasID.value].append(
@@ -216,25 +621,8 @@ class IIIFviewer:
             )
             self.ROIsURLs[self.W_canvasID.value].append(self.lastRoIURL)
 
-        def requestResource(url):
-            response = requests.get(url)
-            if response.ok:
-                self.manifest = response.json()
-                # TODO: why I can't read the self.manifest
-                mnf = response.json()
-                if mnf["type"] == "Collection":
-                    print(f"Select a Manifest:")
-                    for ind, item in enumerate(mnf["items"]):
-                        label = tryLanguage(item["label"])
-                        print(f"{ind+1} - {item['type']}: {label} {item['id']} ")
-                    manifestIndex = int(input("Select manifest index: ")) - 1
-                    return requestResource(mnf["items"][manifestIndex]["id"])
-                return mnf
-            else:
-                raise ValueError("Could not get the Manifest.")
-
         if self.manifest is None or forceReload:
-            mnf = requestResource(self.url)
+            mnf = self.load()
             # {region}/{size}/{rotation}/{quality}.{format}
             self.W_canvasID = widgets.BoundedIntText(
                 description="Canvas:", min=0, max=len(mnf["items"]) - 1
@@ -284,6 +672,12 @@ class IIIFviewer:
             self.W_saveROIbtn.on_click(saveROIbutton)
             self.W_refreshbtn = widgets.Button(description="Refresh")
             self.W_loadZoombtn = widgets.Button(description="Load Zoom")
+            self.W_deepzoom = widgets.Checkbox(
+                value=False, description="Deep zoom (tiles)", disabled=False
+            )
+            self.W_autorefine = widgets.Checkbox(
+                value=False, description="Auto refine", disabled=False
+            )
 
         else:
             mnf = self.manifest
@@ -301,14 +695,11 @@ class IIIFviewer:
             width = x2 - x1
             height = y2 - y1
             self.lastRoIabsolute = [x1,y1,width,height]
-            self.lastRoI = [
-                round(x1 / self._lcnv_width * 100, 2),
-                round(y1 / self._lcnv_height * 100, 2),
-                round(width / self._lcnv_width * 100, 2),
-                round(height / self._lcnv_height * 100, 2),
-            ]
-            region = ",".join(map(str, self.lastRoI))
-            self.lastRoIURL = self.get_currentImageURL(region=f"pct:{region}")
+            self.lastRoI = boxes_to_pct(
+                self.lastRoIabsolute, self._lcnv_width, self._lcnv_height, 2
+            ).tolist()
+            region = format_region(self.lastRoI, pct=True)
+            self.lastRoIURL = self.get_currentImageURL(region=region)
 
         def toggle_selector(event):
             print("Key pressed.")
@@ -323,23 +714,7 @@ class IIIFviewer:
                         selector.set_active(True)
 
         def getTarget(iiifObjectWithTarget):
-            target = iiifObjectWithTarget["target"]
-            if isinstance(target, str):
-                return ("region", target.split("#xywh="))
-            elif isinstance(target, dict):
-                if "source" in target and "selector" not in target:
-                    return ("region", target["source"].split("#xywh="))
-                if "source" in target and "selector" in target:
-                    if target["selector"]["type"] == "PointSelector":
-                        x = target["selector"].get("x")
-                        y = target["selector"].get("y")
-                        t = target["selector"].get("t")
-                        return ("PointSelector", (x, y, t))
-                    if target["selector"]["type"] == "ImageApiSelector":
-                        if "region" in target["selector"]:
-                            return ("region", target["selector"]["region"])
-                    else:
-                        raise ValueError(f"{target['selector']['type']} not supported")
+            return utils.getTarget(iiifObjectWithTarget)
 
         def createHTMLtable(keyValueObj):
             """
@@ -390,6 +765,9 @@ class IIIFviewer:
         # Matplotlib interface
         self.fig = plt.figure(manifestLabel)
         self.ax = self.fig.subplots(1)
+        self.layers = LayerManager(self.ax, max_bytes=self.layer_memory)
+        self.annotations = AnnotationOverlay(self.ax)
+        self.annotations.set_visible(self.W_annotations.value)
         ## Rectangle selectors
         selectors = []
         selectors.append(
@@ -406,8 +784,112 @@ class IIIFviewer:
         )
         self.fig.canvas.mpl_connect("key_press_event", toggle_selector)
 
+        def fetch_refinement(service_url, region, displaysize, cancel):
+            # runs in a worker thread: no widgets or matplotlib here
+            left, top, right, bottom = region
+            canvas_size = (self._lcnv_width, self._lcnv_height)
+            image_size = canvas_size
+            info = None
+            try:
+                info = self.get_imageInfo(service_url)
+                image_size = (info.width, info.height)
+            except (OSError, ValueError, KeyError):
+                pass
+            ix, iy, iw, ih = (
+                int(v)
+                for v in rescale_boxes(
+                    (left, top, right - left, bottom - top), canvas_size, image_size
+                )
+            )
+            if self.W_deepzoom.value and info is not None and info.tile_size:
+                img, (ix0, ix1, iy0, iy1) = fetch_region_tiles(
+                    self.fetcher,
+                    info,
+                    service_url,
+                    ix,
+                    iy,
+                    iw,
+                    ih,
+                    displaysize[0],
+                    self.W_quality.value,
+                    self.W_img_format.value,
+                    allocate=self.layers.buffer,
+                    cancel=cancel,
+                )
+            else:
+                url = region_url(
+                    service_url,
+                    f"{ix},{iy},{iw},{ih}",
+                    f"!{displaysize[0]},{displaysize[1]}",
+                    0,
+                    self.W_quality.value,
+                    self.W_img_format.value,
+                )
+                img = self.fetcher.imread(url, cancel=cancel)
+                ix0, ix1, iy0, iy1 = ix, ix + iw, iy, iy + ih
+            extent = _canvas_extent(
+                (ix0, iy0, ix1 - ix0, iy1 - iy0), image_size, canvas_size
+            )
+            return img, extent
+
+        def clear_refinement():
+            self._refineloader.cancel()
+            self._refinedview = None
+            self.layers.remove("refine")
+
+        def show_refinement(result):
+            img, extent = result
+            self.layers.add("refine", img, extent, replace=True)
+            self.fig.canvas.draw_idle()
+
+        def refine_view():
+            """Request the visible region at the resolution of the axes."""
+            if (
+                not self.W_autorefine.value
+                or not self._imagePlotted
+                or self.service_url is None
+                or self.W_rot_fld.value != 0
+            ):
+                return
+            x1, x2 = self.ax.get_xlim()
+            y1, y2 = self.ax.get_ylim()
+            if (x1, x2, y1, y2) == self._refinedview:
+                return
+            self._refinedview = (x1, x2, y1, y2)
+            left, right = max(x1 + 0.5, 0), min(x2 + 0.5, self._lcnv_width)
+            top, bottom = max(y2 + 0.5, 0), min(y1 + 0.5, self._lcnv_height)
+            if left >= right or top >= bottom:
+                return
+            if right - left >= self._lcnv_width and bottom - top >= self._lcnv_height:
+                # the whole canvas is visible, the preview is enough
+                clear_refinement()
+                return
+            bbox = self.ax.get_window_extent()
+            displaysize = (
+                max(1, round(bbox.width * (right - left) / (x2 - x1))),
+                max(1, round(bbox.height * (bottom - top) / (y1 - y2))),
+            )
+            service_url = self.service_url
+            self._refineloader.request(
+                lambda cancel: fetch_refinement(
+                    service_url, (left, top, right, bottom), displaysize, cancel
+                ),
+                show_refinement,
+            )
+
+        refine_debounced = Debouncer(self.refine_delay, refine_view)
+
+        def on_view_change():
+            # only the annotations in view are drawn
+            if self._imagePlotted:
+                self.annotations.cull()
+            if self.W_autorefine.value:
+                # the view moved: what was requested for the old one is stale
+                self._refineloader.cancel()
+                refine_debounced()
+
         def on_xlims_change(event_ax):
-            print("updated xlims: ", event_ax.get_xlim())
+            on_view_change()
 
         def updateZoomRegionExtent(event_ax):
                 x1,x2 = event_ax.get_xlim()
@@ -428,9 +910,9 @@ class IIIFviewer:
                     #self.ax.imshow(img, extent=extent)
 
         def on_ylims_change(event_ax):
-            print("updated ylims: ", event_ax.get_ylim())
             if self._imagePlotted:
                 updateZoomRegionExtent(event_ax)
+            on_view_change()
 
 
         self.ax.callbacks.connect('xlim_changed',on_xlims_change)
@@ -447,50 +929,13 @@ class IIIFviewer:
             self.ax.set_ylabel(textstr, fontsize=6)
 
         def get_annotations(annopage_item):
-            # we check that we want to display the annotations
-            if self.W_annotations.value:
-                selectortype, fragments = getTarget(annopage_item)
-                if selectortype == "region":
-                    if len(fragments) > 1:
-                        if isinstance(fragments,list):
-                            fragment = fragments[-1]
-                        else:
-                            fragment = fragments
-                        if fragment.startswith("pct:"):
-                            print("Not implemented")
-                            fragment = fragment.strip("pct:")
-                            xi, yi, wi, hi = map(float, fragment.split(","))
-                            x = xi / 100 * self._lcnv_width
-                            y = yi / 100 * self._lcnv_height
-                            width = wi / 100 * self._lcnv_width
-                            height = hi / 100 * self._lcnv_height
-                        else:
-                            x, y, width, height = map(float, fragment.split(","))
+            # the targets are collected and drawn all at once by update_image,
+            # hidden if we don't want to display them
+            self.annotations.add(annopage_item)
 
-                    else:
-                        # whole canvas case
-                        x = 0
-                        y = 0
-                        width = self._lcnv_width
-                        height = self._lcnv_height
-                    rect = patches.Rectangle(
-                        (x, y),
-                        width,
-                        height,
-                        linewidth=4,
-                        edgecolor="r",
-                        facecolor="none",
-                    )
-                    # Add the patch to the Axes
-                    self.ax.add_patch(rect)
-                if selectortype == "PointSelector":
-                    x, y, _ = fragments
-                    self.ax.scatter(x, y)
-                    #self.ax.set_xlim(0,self._limgwidth)
-                    #self.ax.set_ylim(0,self._limgheight)
-            # if we don't want to display them we romove any
-            else:
-                for p in reversed(self.ax.patches):p.remove()
+        def toggle_annotations(change):
+            self.annotations.set_visible(change["new"])
+            self.fig.canvas.draw_idle()
 
         def check_body(body):
             if body["type"] == "SpecificResource":
@@ -499,120 +944,137 @@ class IIIFviewer:
                 )
             if body["type"] == "TextualBody":
                 return body["value"] + "<br>"
+            return ""
 
         def get_annobodies(annoitem):
             if isinstance(annoitem["body"], list):
-                annostr = ""
-                for body in annoitem["body"]:
-                    annostr += check_body(body)
+                annostr = "".join(check_body(body) for body in annoitem["body"])
             else:
                 annostr = f"{self._lannotations_count} - {check_body(annoitem['body'])} - {getTarget(annoitem)} <br>"
             return annostr
 
-        def update_image(canvasindex):
+        def show_annotation_page(result):
+            page, annotations_list = result
+            rows = []
+            for item in page["items"]:
+                self._lannotations_count += 1
+                rows.append(get_annobodies(item))
+                get_annotations(item)
+            annotations_list.extend(rows)
+            self.annotations.draw(self._lcnv_width, self._lcnv_height)
+            self.W_annotations.disabled = self._lannotations_count == 0
+            self.fig.canvas.draw_idle()
+
+        def load_annotation_pages(refs, resource_refs):
+            # the pages of the canvas, then the ones of the image
+            lists = (
+                (refs, self._annotations_list),
+                (resource_refs, self._contentresource_annotations_list),
+            )
+
+            def fetch(cancel, emit):
+                for pagerefs, annotations_list in lists:
+                    for page in self.annotationpages.iter_pages(pagerefs, cancel):
+                        emit((page, annotations_list))
+
+            self._annotationloader.request(
+                fetch, lambda result: None, partial=show_annotation_page
+            )
+
+        def update_image(canvasindex, img=None):
             # I can't self.ax.cla() here because will stop the ROI selctor.
             # for i in self.ax.images: i.remove()
-            for p in reversed(self.ax.patches):p.remove()
-            #for l in self.ax.lines
-            for c in self.ax.collections: c.remove()
+            self.annotations.clear()
+            self._lannotations_count = 0
+            # the rows of the annotation lists, sent once per canvas
+            annorows = []
+            contentresourcerows = []
+            # pages of the image referenced by id, loaded with the canvas ones
+            resource_refs = []
+            # zoom, tile and refinement layers belong to the previous canvas
+            clear_refinement()
+            self.layers.remove()
             canvas = mnf["items"][canvasindex]
-            self._lcnv_width = int(canvas["width"])
-            self._lcnv_height = int(canvas["height"])
+            record = self.canvas_index[canvasindex]
+            self._lcnv_width = record.width
+            self._lcnv_height = record.height
             self.service_url = None
-            for cnvitm in canvas["items"]:
-                if cnvitm["type"] == "AnnotationPage":
-                    for ann in cnvitm["items"]:
-                        if ann["motivation"] == "painting":
-                            body = ann["body"]
-                            if body["type"] == "Choice":
-                                if self.W_choiceelem.value == "none":
-                                    ic = body["items"]
-                                    opts = [
-                                        (tryLanguage(j["label"]), i)
-                                        for i, j in enumerate(ic)
-                                    ]
-                                    self.W_choiceelem.options = opts
-                                    contentresource = body["items"][0]
-                                else:
-                                    contentresource = body["items"][
-                                        self.W_choiceelem.value
-                                    ]
-
-                            if body["type"] == "Image":
-                                contentresource = body
-                                self.W_choiceelem.disabled = True
-
-                            if body["type"] == "SpecificResource":
-                                contentresource = body["source"]
-
-                            if "service" in contentresource:
-                                for service in contentresource["service"]:
-
-                                    if service["type"].startswith("ImageService"):
-                                        region = None
-                                        self.service_url = service["id"]
-                                        if "selector" in body:
-                                            if body["selector"]["type"] in [
-                                                "iiif:ImageApiSelector",
-                                                "ImageApiSelector",
-                                            ]:
-                                                region = body["selector"]["region"]
-
-                                        imageurl = self.get_currentImageURL(
-                                            preview=True, region=region
-                                        )
-                                        if "annotations" in service:
-                                            annostr = ""
-                                            for annopage in service["annotations"]:
-                                                for item in annopage["items"]:
-                                                    self._lannotations_count += 1
-                                                    annostr += get_annobodies(
-                                                        annoitem=item
-                                                    )
-                                                    get_annotations(item)
-                                            self._contentresource_annotations_html.value += (
-                                                annostr
-                                            )
-                            else:
-                                imageurl = contentresource["id"]
-                                self.W_final_size.disabled = True
-                                self.W_preview_size.disabled = True
-                                self.W_rot_fld.disabled = True
-                                self.W_quality.disabled = True
-                                self.W_region.disabled = True
-                                self.W_img_format.disabled = True
-
-                            ## Read the image
-                            self.img = io.imread(imageurl)
-                            # used by the selector
-                            self._limgwidth = self.img.shape[1]
-                            self._limgheight = self.img.shape[0]
-                            if "annotations" in contentresource:
-                                annostr = ""
-                                for annopage in contentresource["annotations"]:
-                                    for item in annopage["items"]:
-                                        annostr += get_annobodies(annoitem=item)
-                                        get_annotations(item)
-                                self._contentresource_annotations_html.value += annostr
-
-                            generalinfo = "<br>".join(
-                                [
-                                    f"{i}: {contentresource[i]}"
-                                    for i in contentresource
-                                    if isinstance(contentresource[i], (str, float, int))
-                                ]
-                            )
-                            self._ccontentresource_info_html.value = generalinfo
+            if record.layers:
+                if record.is_choice:
+                    if self.W_choiceelem.value == "none":
+                        opts = [
+                            (tryLanguage(layer.label), i)
+                            for i, layer in enumerate(record.layers)
+                        ]
+                        self.W_choiceelem.options = opts
+                        layer = record.layers[0]
+                    else:
+                        layer = record.layer(self.W_choiceelem.value)
+                else:
+                    layer = record.layers[0]
+                    self.W_choiceelem.disabled = True
+                contentresource = layer.resource
+
+                if layer.service_id is not None:
+                    self.service_url = layer.service_id
+                    imageurl = self.get_currentImageURL(
+                        preview=True, region=record.selector_region
+                    )
+                    if "annotations" in layer.service:
+                        for annopage in layer.service["annotations"]:
+                            if "items" not in annopage and "id" in annopage:
+                                resource_refs.append(annopage["id"])
+                            for item in annopage.get("items", []):
+                                self._lannotations_count += 1
+                                contentresourcerows.append(get_annobodies(item))
+                                get_annotations(item)
+                else:
+                    imageurl = layer.image_id
+                    self.W_final_size.disabled = True
+                    self.W_preview_size.disabled = True
+                    self.W_rot_fld.disabled = True
+                    self.W_quality.disabled = True
+                    self.W_region.disabled = True
+                    self.W_img_format.disabled = True
+
+                ## Read the image (if it was not loaded in background)
+                if img is None:
+                    img = self._readImage(imageurl)
+                self.img = img
+                # used by the selector
+                self._limgwidth = self.img.shape[1]
+                self._limgheight = self.img.shape[0]
+                if "annotations" in contentresource:
+                    for annopage in contentresource["annotations"]:
+                        if "items" not in annopage and "id" in annopage:
+                            resource_refs.append(annopage["id"])
+                        for item in annopage.get("items", []):
+                            contentresourcerows.append(get_annobodies(item))
+                            get_annotations(item)
+
+                generalinfo = "<br>".join(
+                    [
+                        f"{i}: {contentresource[i]}"
+                        for i in contentresource
+                        if isinstance(contentresource[i], (str, float, int))
+                    ]
+                )
+                self._ccontentresource_info_html.value = generalinfo
 
             cmap = None
             if len(self.img.shape) < 3:
                 cmap = "gray"
-            if self.image is None:
-                extent = (-0.5, self._lcnv_width-0.5, self._lcnv_height-0.5, -0.5)
-                self.image = self.ax.imshow(self.img, cmap=cmap,extent=extent)
-            #self.ax.set_aspect('equal', adjustable='box')
-            else:
-                self.image.set_data(self.img)
+            with self.profiler.stage("imshow", canvas=canvasindex):
+                if self.image is None:
+                    extent = (-0.5, self._lcnv_width-0.5, self._lcnv_height-0.5, -0.5)
+                    self.image = self.ax.imshow(self.img, cmap=cmap,extent=extent)
+                #self.ax.set_aspect('equal', adjustable='box')
+                else:
+                    self.image.set_data(self.img)
+                    extent = (-0.5, self._lcnv_width-0.5, self._lcnv_height-0.5, -0.5)
+                    if tuple(self.image.get_extent()) != extent:
+                        self.image.set_extent(extent)
+                self.layers.set_base(self.image)
             self._imagePlotted = True
             #self.fig.canvas.draw()
             if "label" in canvas:
@@ -634,27 +1096,85 @@ class IIIFviewer:
                 self._canvasMetadataTable.value = createHTMLtable(canvas["metadata"])
 
             ### Annotations
-            if "annotations" in canvas:
-                annostr = ""
-                for annopage in canvas["annotations"]:
+            with self.profiler.stage("annotations", canvas=canvasindex):
+                for annopage in record.annotation_pages:
                     for item in annopage["items"]:
                         self._lannotations_count += 1
-                        annostr += get_annobodies(annoitem=item)
+                        annorows.append(get_annobodies(item))
                         get_annotations(item)
-                self._annotations_html.value = annostr
-
+                self.annotations.draw(self._lcnv_width, self._lcnv_height)
+            with self.profiler.stage("widgets", canvas=canvasindex):
+                self._annotations_list.set_rows(annorows)
+                self._contentresource_annotations_list.set_rows(
+                    contentresourcerows
+                )
             if self._lannotations_count > 0:
                 self.W_annotations.disabled = False
             else:
                 self.W_annotations.disabled = True
+            # the pages referenced by id are added as they arrive
+            if record.annotation_refs or resource_refs:
+                load_annotation_pages(record.annotation_refs, resource_refs)
+            else:
+                self._annotationloader.cancel()
+            if self.prefetcher is not None:
+                self.prefetcher.update(canvasindex, len(mnf["items"]))
             # Sow image
             plt.show()
 
+        def canvas_loaded(canvasindex, img, nbytes, requested):
+            # the image is read here if it was not loaded in background
+            with self.profiler.context(canvas=canvasindex) as loaded:
+                update_image(canvasindex, img)
+            nbytes += loaded.get("fetch", 0)
+            elapsed = time.perf_counter() - requested
+            self.profiler.record("canvas", requested, canvas=canvasindex, bytes=nbytes)
+            if self._stats_html is not None:
+                self._stats_html.value = (
+                    f"<p>Canvas {canvasindex}: {elapsed:.3f} s, "
+                    f"{nbytes / 2**20:.2f} MiB downloaded</p>" + self.profiler.html()
+                )
+
+        def show_thumbnail(canvasindex, thumbnail):
+            # drawn in place of the image, stretched to the canvas extent
+            record = self.canvas_index[canvasindex]
+            extent = (-0.5, record.width - 0.5, record.height - 0.5, -0.5)
+            if self.image is None:
+                self.image = self.ax.imshow(thumbnail, extent=extent)
+            else:
+                self.image.set_data(thumbnail)
+                if tuple(self.image.get_extent()) != extent:
+                    self.image.set_extent(extent)
+            if record.label is not None:
+                self.ax.set_title(tryLanguage(record.label))
+            self.fig.canvas.draw_idle()
+
         def view_image(change):
             # using self.ax.cla() we will remove also the connector
             i = self.W_canvasID.value
             if i < len(mnf["items"]):
-                update_image(i)
+                # the image is downloaded in background and only the last
+                # canvas selected is drawn
+                requested = time.perf_counter()
+
+                def fetch(cancel, emit):
+                    # the downloads of this thread are counted for the canvas
+                    with self.profiler.context(canvas=i) as loaded:
+                        images, _ = self._canvasURLs(i)
+                        if not images:
+                            return None, loaded.get("fetch", 0)
+                        if self.progressive and not self._isLocal(images[0]):
+                            thumbnail = self._thumbnailURL(i)
+                            if thumbnail is not None:
+                                emit(self.fetcher.imread(thumbnail, cancel=cancel))
+                        img = self._readImage(images[0], cancel)
+                    return img, loaded.get("fetch", 0)
+
+                self._canvasloader.request(
+                    fetch,
+                    lambda result: canvas_loaded(i, *result, requested),
+                    partial=lambda thumbnail: show_thumbnail(i, thumbnail),
+                )
             else:
                 print("Canvas number exceeds the number of Canvas")
 
@@ -662,14 +1182,52 @@ class IIIFviewer:
             for i in self.ax._children:
                 if isinstance(i,matplotlib.image.AxesImage):
                     i.remove()
+            self.layers.clear()
+            self._refinedview = None
             cmap = None
             extent = (-0.5, self._lcnv_width-0.5, self._lcnv_height-0.5, -0.5)
             self.image = self.ax.imshow(self.img, cmap=cmap,extent=extent)
+            self.layers.set_base(self.image)
             self.fig.canvas.draw()
 
+        def load_zoomtiles(info):
+            # only the tiles of the visible part at the resolution of the axes
+            x1, x2 = self.ax.get_xlim()
+            y1, y2 = self.ax.get_ylim()
+            left, right = max(x1 + 0.5, 0), min(x2 + 0.5, self._lcnv_width)
+            top, bottom = max(y2 + 0.5, 0), min(y1 + 0.5, self._lcnv_height)
+            if left >= right or top >= bottom:
+                # panned outside the image: no tiles to load
+                return
+            canvas_size = (self._lcnv_width, self._lcnv_height)
+            image_size = (info.width, info.height)
+            box = rescale_boxes(
+                (left, top, right - left, bottom - top), canvas_size, image_size
+            )
+            img, (ix0, ix1, iy0, iy1) = fetch_region_tiles(
+                self.fetcher,
+                info,
+                self.service_url,
+                *box,
+                self.ax.get_window_extent().width,
+                self.W_quality.value,
+                self.W_img_format.value,
+                allocate=self.layers.buffer,
+            )
+            extent = _canvas_extent(
+                (ix0, iy0, ix1 - ix0, iy1 - iy0), image_size, canvas_size
+            )
+            self.layers.add("tile", img, extent)
+
         def load_zoom(change):
-            img = io.imread(self.zoomregion)
-            self.ax.imshow(img,extent=self.zoomextent)
+            if self.W_deepzoom.value and self.service_url is not None:
+                info = self.get_imageInfo()
+                if info.tile_size is not None:
+                    load_zoomtiles(info)
+                    self.fig.canvas.draw()
+                    return
+            img = self.fetcher.imread(self.zoomregion)
+            self.layers.add("zoom", img, self.zoomextent)
             self.fig.canvas.draw()
 
         def getseeAlso(obj):
@@ -687,7 +1245,7 @@ class IIIFviewer:
                 seeAlsohtml += "<br>"
             return seeAlsohtml
 
-        self.W_annotations.observe(view_image, names="value")
+        self.W_annotations.observe(toggle_annotations, names="value")
         self.W_choiceelem.observe(view_image, names="value")
         self.W_canvasID.observe(view_image, names="value")
         accordionitems = []
@@ -778,7 +1336,7 @@ class IIIFviewer:
             self.canvas_info = widgets.Accordion(
                 children=[
                     self._cavnas_info_html,
-                    self._annotations_html,
+                    self._annotations_list.widget,
                     self._canvasMetadataTable,
                 ]
             )
@@ -793,12 +1351,19 @@ class IIIFviewer:
             )
             HBOX3 = widgets.HBox([self.W_rot_fld, self.W_quality, self.W_img_format])
             HBOX4 = widgets.HBox(
-                [self.W_RoI_comment, self.W_saveROIbtn, self.W_refreshbtn, self.W_loadZoombtn]
+                [
+                    self.W_RoI_comment,
+                    self.W_saveROIbtn,
+                    self.W_refreshbtn,
+                    self.W_loadZoombtn,
+                    self.W_deepzoom,
+                    self.W_autorefine,
+                ]
             )
             contentresource = widgets.Accordion(
                 children=[
                     self._ccontentresource_info_html,
-                    self._contentresource_annotations_html,
+                    self._contentresource_annotations_list.widget,
                 ]
             )
             contentresource.set_title(0, "General infos")
@@ -812,6 +1377,10 @@ class IIIFviewer:
                 self.canvas_info,
                 contentresource,
             ]
+            if self.profiler.enabled:
+                self._stats_html = widgets.HTML(self.profiler.html())
+                self._tab_nest.children += (self._stats_html,)
+                self._tab_nest.set_title(4, "Stats")
             display(self._tab_nest)
-        update_image(0)
+        canvas_loaded(0, None, 0, time.perf_counter())
         return self._tab_nest
@@ -0,0 +1,127 @@
+"""
+Drawing of the annotations of a canvas. The targets are collected while the
+annotation pages are read and indexed at once; only the annotations in view
+are drawn, all the regions in a single PolyCollection and all the points in a
+single scatter, so canvases with thousands of annotations (e.g. OCR lines or
+words) are drawn, hidden and panned by updating two artists.
+"""
+from matplotlib.collections import PolyCollection
+import numpy as np
+
+from .spatial import AnnotationIndex, thin
+
+
+class AnnotationOverlay:
+    def __init__(self, ax, linewidth=4, edgecolor="r", min_pixels=2, max_drawn=2000):
+        """The artists of the annotations drawn over the canvas.
+
+        Args:
+            ax (matplotlib.axes.Axes): The axes of the viewer.
+            linewidth (float, optional): Width of the region borders.
+            Defaults to 4.
+            edgecolor (str, optional): Color of the region borders. Defaults
+            to "r".
+            min_pixels (float, optional): Regions smaller than this on screen
+            are not drawn. Defaults to 2.
+            max_drawn (int, optional): Maximum number of regions drawn, when
+            more are in view the largest are drawn. Defaults to 2000.
+        """
+        self.ax = ax
+        self.linewidth = linewidth
+        self.edgecolor = edgecolor
+        self.min_pixels = min_pixels
+        self.max_drawn = max_drawn
+        self.items = []
+        self.index = AnnotationIndex([], 1, 1)
+        self._polys = None
+        self._scatter = None
+        self.visible = True
+
+    def __len__(self):
+        return len(self.index)
+
+    def clear(self):
+        """Forget the annotations collected, e.g. when changing canvas."""
+        self.items = []
+
+    def add(self, item):
+        """Collect an annotation to be drawn."""
+        self.items.append(item)
+
+    def draw(self, width, height):
+        """Index the annotations collected and draw the ones in view.
+
+        Args:
+            width (float): Width of the canvas the targets refer to.
+            height (float): Height of the canvas.
+        """
+        self.index = AnnotationIndex(self.items, width, height)
+        self.cull()
+
+    def query(self, box):
+        """Return the annotations intersecting a box (x, y, width, height in
+        canvas pixels)."""
+        return self.index.within(box)
+
+    def cull(self):
+        """Update the artists with the annotations in the current view."""
+        x1, x2 = self.ax.get_xlim()
+        y1, y2 = self.ax.get_ylim()
+        view = (min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1))
+        pixel_size = view[2] / max(self.ax.bbox.width, 1)
+        visible = self.index.query(view)
+        points = visible[self.index.is_point[visible]]
+        regions = thin(
+            self.index.boxes,
+            visible[~self.index.is_point[visible]],
+            pixel_size,
+            self.min_pixels,
+            self.max_drawn,
+        )
+        boxes = self.index.boxes[regions]
+        x0, y0 = boxes[:, 0], boxes[:, 1]
+        x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+        verts = np.stack(
+            [
+                np.stack([x0, y0], axis=1),
+                np.stack([x1, y0], axis=1),
+                np.stack([x1, y1], axis=1),
+                np.stack([x0, y1], axis=1),
+            ],
+            axis=1,
+        )
+        if self._polys is None:
+            self._polys = PolyCollection(
+                verts,
+                linewidths=self.linewidth,
+                edgecolors=self.edgecolor,
+                facecolors="none",
+            )
+            # the view is set by the image, not by the annotations
+            self.ax.add_collection(self._polys, autolim=False)
+        else:
+            self._polys.set_verts(verts)
+        offsets = self.index.boxes[points, :2]
+        if self._scatter is None:
+            xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+            self._scatter = self.ax.scatter(offsets[:, 0], offsets[:, 1])
+            self.ax.set_xlim(xlim, emit=False, auto=None)
+            self.ax.set_ylim(ylim, emit=False, auto=None)
+        else:
+            self._scatter.set_offsets(offsets)
+        self.set_visible(self.visible)
+
+    def set_visible(self, visible):
+        """Show or hide all the annotations without rebuilding the artists."""
+        self.visible = visible
+        for artist in (self._polys, self._scatter):
+            if artist is not None:
+                artist.set_visible(visible)
+
+    def remove(self):
+        """Remove the artists from the axes."""
+        for artist in (self._polys, self._scatter):
+            if artist is not None:
+                artist.remove()
+        self._polys = None
+        self._scatter = None
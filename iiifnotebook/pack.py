@@ -0,0 +1,232 @@
+"""
+Offline packs: a manifest, its annotation pages, the info.json of its image
+services and its images at chosen sizes (or their full tile pyramids) stored
+in a single zip file. The images are stored decoded as uncompressed .npy
+members, so reading them is a memory map of the zip at the offset of the
+member, without decoding or copying. A Fetcher given a pack answers the URLs
+it contains from it, so the viewer works without the network.
+"""
+from concurrent.futures import FIRST_COMPLETED, wait
+import json
+from logging import warning
+import zipfile
+
+import numpy as np
+
+from .annopages import _ref
+from .imageservice import ImageInfo, region_url
+
+# name of the member listing the URLs stored in the pack
+PACKINDEX = "pack.json"
+
+
+class Pack:
+    def __init__(self, path):
+        """Read an offline pack written by export_pack.
+
+        Args:
+            path (str): The zip file.
+        """
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        meta = json.loads(self._zip.read(PACKINDEX))
+        self.url = meta["url"]
+        self.members = meta["members"]
+        self._offsets = {}
+
+    def __contains__(self, url):
+        return url in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def is_image(self, url):
+        return self.members.get(url, "").endswith(".npy")
+
+    def get_bytes(self, url):
+        """Return a stored JSON document (manifest, info.json, page)."""
+        return self._zip.read(self.members[url])
+
+    def _offset(self, name):
+        # the data of a member follows its local header, whose extra field
+        # can differ from the one in the central directory
+        if name not in self._offsets:
+            info = self._zip.getinfo(name)
+            with open(self.path, "rb") as f:
+                f.seek(info.header_offset)
+                header = f.read(zipfile.sizeFileHeader)
+                namelength = int.from_bytes(header[26:28], "little")
+                extralength = int.from_bytes(header[28:30], "little")
+                f.seek(namelength + extralength, 1)
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+                self._offsets[name] = (f.tell(), shape, fortran, dtype)
+        return self._offsets[name]
+
+    def imread(self, url):
+        """Return a stored image as a read-only array mapped from the zip."""
+        offset, shape, fortran, dtype = self._offset(self.members[url])
+        return np.memmap(
+            self.path,
+            dtype=dtype,
+            mode="r",
+            offset=offset,
+            shape=shape,
+            order="F" if fortran else "C",
+        )
+
+    def close(self):
+        self._zip.close()
+
+
+def _write_array(zf, name, img):
+    img = np.ascontiguousarray(img)
+    with zf.open(name, "w", force_zip64=img.nbytes > 2**31) as f:
+        np.lib.format.write_array(f, img, allow_pickle=False)
+
+
+def export_pack(
+    core,
+    path,
+    sizes=("400,", "max"),
+    canvases=None,
+    region=None,
+    quality="default",
+    fmt="jpg",
+    tiles=False,
+    annotations=True,
+):
+    """Download a manifest and its images into an offline pack.
+
+    The images are requested with the same URLs the viewer builds, so a
+    viewer opened on the pack finds them when its preview and final sizes
+    are among the sizes exported (the default ones of the viewer are).
+
+    Args:
+        core (IIIFcore): The opened manifest.
+        path (str): The zip file written.
+        sizes (list, optional): The size parameters of the images stored for
+        every canvas and layer of a Choice. Defaults to ("400,", "max").
+        canvases (list, optional): The canvas indices. Defaults to all.
+        region (str, optional): The region parameter. Defaults to the region
+        of the ImageApiSelector of each canvas or "full".
+        quality (str, optional): Defaults to "default".
+        fmt (str, optional): Defaults to "jpg".
+        tiles (bool, optional): Store also all the tiles of every level of
+        the image services, for deep zooming offline. Defaults to False.
+        annotations (bool, optional): Store the annotation pages referenced
+        by the canvases. Defaults to True.
+
+    Returns:
+        Pack: The pack written.
+    """
+    fetcher = core.fetcher
+    index = core.canvas_index
+    if canvases is None:
+        canvases = range(len(index))
+    members = {}
+    documents = {}
+    manifest_url = core.manifest.get("id", core.url)
+    documents[manifest_url] = json.dumps(core.manifest).encode("utf-8")
+    images = []
+    services = []
+    refs = []
+    for canvas in canvases:
+        record = index[canvas]
+        refs.extend(record.annotation_refs)
+        for choice, layer in enumerate(record.layers):
+            # the pages of the image the viewer loads with the canvas ones
+            for resource in (layer.service or {}, layer.resource):
+                refs.extend(
+                    page["id"]
+                    for page in resource.get("annotations", [])
+                    if "items" not in page and "id" in page
+                )
+            if layer.service_id is not None and layer.service_id not in services:
+                services.append(layer.service_id)
+            for size in sizes:
+                url = index.image_url(canvas, region, size, 0, quality, fmt, choice)
+                if url is not None and url not in images:
+                    images.append(url)
+    infos = [fetcher.submit(fetcher.get_bytes, f"{s}/info.json") for s in services]
+    for service, future in zip(services, infos):
+        url = f"{service}/info.json"
+        try:
+            documents[url] = future.result()
+        except (OSError, ValueError) as e:
+            warning(f"Could not download {url}: {e}")
+            continue
+        if tiles:
+            info = ImageInfo(json.loads(documents[url]))
+            if info.tile_size is None:
+                continue
+            for factor in info.scale_factors:
+                for tx, ty, tw, th, size in info.tiles_for_region(
+                    0, 0, info.width, info.height, factor
+                ):
+                    images.append(
+                        region_url(
+                            service, f"{tx},{ty},{tw},{th}", size, 0, quality, fmt
+                        )
+                    )
+    if annotations:
+        # the pages are requested together, the next ones as soon as the
+        # page linking them arrives
+        pending = {
+            fetcher.submit(fetcher.get_bytes, url): url for url in dict.fromkeys(refs)
+        }
+        seen = set(pending.values())
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    data = future.result()
+                    page = json.loads(data)
+                except (OSError, ValueError) as e:
+                    warning(f"Could not download the annotation page {url}: {e}")
+                    continue
+                documents[url] = data
+                for link in (page.get("first"), page.get("next")):
+                    following = _ref(link)
+                    if following is not None and following not in seen:
+                        seen.add(following)
+                        pending[fetcher.submit(fetcher.get_bytes, following)] = (
+                            following
+                        )
+    with zipfile.ZipFile(path, "w", allowZip64=True) as zf:
+        for number, (url, data) in enumerate(documents.items()):
+            name = f"json/{number}.json"
+            zf.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+            members[url] = name
+        # at most two images per download thread are kept in memory
+        todo = iter(enumerate(images))
+        downloads = {}
+        while True:
+            while len(downloads) < 2 * fetcher.workers:
+                number, url = next(todo, (None, None))
+                if url is None:
+                    break
+                downloads[fetcher.submit(fetcher.imread, url)] = (number, url)
+            if not downloads:
+                break
+            done, _ = wait(downloads, return_when=FIRST_COMPLETED)
+            for future in done:
+                number, url = downloads.pop(future)
+                try:
+                    img = future.result()
+                except (OSError, ValueError) as e:
+                    warning(f"Could not download {url}: {e}")
+                    continue
+                name = f"images/{number}.npy"
+                _write_array(zf, name, img)
+                members[url] = name
+        zf.writestr(
+            PACKINDEX,
+            json.dumps({"url": manifest_url, "members": members}),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+    return Pack(path)
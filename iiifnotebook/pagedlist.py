@@ -0,0 +1,142 @@
+"""
+A list of HTML rows shown one page at a time. Assigning the value of a HTML
+widget sends the whole string to the browser, so long lists (e.g. thousands
+of transcription annotations) are kept in Python and only the visible page is
+sent.
+"""
+import ipywidgets as widgets
+
+
+class PagedHTML:
+    def __init__(self, page_size=50, empty="None"):
+        """A paginated HTML list widget.
+
+        Args:
+            page_size (int, optional): Rows per page. Defaults to 50.
+            empty (str, optional): Shown when there are no rows. Defaults to
+            "None".
+        """
+        self.page_size = page_size
+        self.empty = empty
+        self.rows = []
+        self.page = 0
+        self._html = widgets.HTML(empty)
+        self._label = widgets.Label("")
+        self._prev = widgets.Button(description="<", layout={"width": "40px"})
+        self._next = widgets.Button(description=">", layout={"width": "40px"})
+        self._prev.on_click(lambda b: self.show(self.page - 1))
+        self._next.on_click(lambda b: self.show(self.page + 1))
+        self._nav = widgets.HBox([self._prev, self._label, self._next])
+        self._nav.layout.display = "none"
+        self.widget = widgets.VBox([self._html, self._nav])
+
+    @property
+    def pages(self):
+        return max(1, -(-len(self.rows) // self.page_size))
+
+    def set_rows(self, rows):
+        """Replace the rows and show the first page.
+
+        Args:
+            rows (list): The HTML of each row.
+        """
+        self.rows = list(rows)
+        self._nav.layout.display = "flex" if self.pages > 1 else "none"
+        self.show(0)
+
+    def extend(self, rows):
+        """Append rows keeping the page shown (e.g. for pages loaded later)."""
+        self.rows.extend(rows)
+        self._nav.layout.display = "flex" if self.pages > 1 else "none"
+        self.show(self.page)
+
+    def show(self, page):
+        """Send one page of rows to the browser."""
+        self.page = min(max(page, 0), self.pages - 1)
+        start = self.page * self.page_size
+        stop = min(start + self.page_size, len(self.rows))
+        self._html.value = "".join(self.rows[start:stop]) or self.empty
+        self._label.value = f"{start + 1}-{stop} of {len(self.rows)}"
+        self._prev.disabled = self.page == 0
+        self._next.disabled = self.page == self.pages - 1
+
+
+class CollectionBrowser:
+    def __init__(self, collection, on_open, page_size=50):
+        """A paged and searchable list of the items of a collection.
+
+        Only the labels of the page shown are computed and sent to the
+        browser. Nested collections are opened in place.
+
+        Args:
+            collection (Collection): The collection.
+            on_open (callable): Called with the CollectionItem of the
+            manifest chosen.
+            page_size (int, optional): Items per page. Defaults to 50.
+        """
+        self.on_open = on_open
+        self.page_size = page_size
+        self._stack = []
+        self._search = widgets.Text(placeholder="Search", description="Search:")
+        self._select = widgets.Select(rows=15, layout={"width": "95%"})
+        self._label = widgets.Label("")
+        self._prev = widgets.Button(description="<", layout={"width": "40px"})
+        self._next = widgets.Button(description=">", layout={"width": "40px"})
+        self._back = widgets.Button(description="Back", disabled=True)
+        self._open = widgets.Button(description="Open")
+        self._prev.on_click(lambda b: self.show(self.page - 1))
+        self._next.on_click(lambda b: self.show(self.page + 1))
+        self._back.on_click(self._goback)
+        self._open.on_click(self._openselected)
+        self._search.observe(lambda change: self.show(0), names="value")
+        self.widget = widgets.VBox(
+            [
+                self._search,
+                self._select,
+                widgets.HBox(
+                    [self._prev, self._label, self._next, self._back, self._open]
+                ),
+            ]
+        )
+        self.set_collection(collection)
+
+    def set_collection(self, collection):
+        self.collection = collection
+        self._search.value = ""
+        self.show(0)
+
+    def _items(self):
+        if self._search.value:
+            return list(self.collection.search(self._search.value))
+        return None
+
+    def show(self, page):
+        found = self._items()
+        total = len(self.collection) if found is None else len(found)
+        pages = max(1, -(-total // self.page_size))
+        self.page = min(max(page, 0), pages - 1)
+        start = self.page * self.page_size
+        if found is None:
+            items = self.collection.page(self.page, self.page_size)
+        else:
+            items = found[start : start + self.page_size]
+        self._select.options = [(repr(item), item.index) for item in items]
+        self._label.value = f"{self.page + 1}/{pages} ({total} items)"
+        self._prev.disabled = self.page == 0
+        self._next.disabled = self.page == pages - 1
+
+    def _openselected(self, button):
+        if self._select.value is None:
+            return
+        item = self.collection[self._select.value]
+        if item.is_collection:
+            self._stack.append(self.collection)
+            self._back.disabled = False
+            self.set_collection(self.collection.open(item.index))
+        else:
+            self.on_open(item)
+
+    def _goback(self, button):
+        if self._stack:
+            self.set_collection(self._stack.pop())
+        self._back.disabled = not self._stack
@@ -0,0 +1,186 @@
+"""
+Background prefetching of the canvases next to the one shown, so that turning
+pages does not wait for the network.
+"""
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+import json
+import threading
+
+from .fetcher import DownloadCancelled
+
+
+class Prefetcher:
+    def __init__(self, fetcher, resolve, depth=2, max_bytes=256 * 2**20, workers=2):
+        """Download and decode the resources of the neighbouring canvases.
+
+        Args:
+            fetcher (Fetcher): Used for downloading the resources.
+            resolve (callable): Function receiving a canvas index and returning
+            two lists: the URLs of its images and of its annotation pages.
+            depth (int, optional): Number of canvases prefetched before and
+            after the current one. Defaults to 2.
+            max_bytes (int, optional): Memory budget of the prefetched
+            resources. The ones farthest from the current canvas are dropped
+            first. Defaults to 256 MiB.
+            workers (int, optional): Number of background threads. Defaults
+            to 2.
+        """
+        self.fetcher = fetcher
+        self.resolve = resolve
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.current = None
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._futures = {}
+        # canvas index -> Event interrupting its downloads in progress
+        self._cancels = {}
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="iiifnotebook-prefetch"
+        )
+
+    def _load(self, kind, url, cancel):
+        if kind == "image":
+            data = self.fetcher.imread(url, cancel)
+            return data, data.nbytes
+        raw = self.fetcher.get_bytes(url, cancel)
+        return json.loads(raw), len(raw)
+
+    def _done(self, key, index, future):
+        with self._lock:
+            # the key can be scheduled again after leaving the window
+            if self._futures.get(key, (None,))[0] is future:
+                del self._futures[key]
+            if future.cancelled() or future.exception() is not None:
+                return
+            if not self._wanted(index):
+                return
+            data, size = future.result()
+            self._items[key] = (index, data, size)
+            self.total_bytes += size
+            self._evict()
+
+    def _wanted(self, index):
+        return self.current is not None and abs(index - self.current) <= self.depth
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._items:
+            farthest = max(
+                self._items, key=lambda k: abs(self._items[k][0] - self.current)
+            )
+            _, _, size = self._items.pop(farthest)
+            self.total_bytes -= size
+
+    def update(self, index, count):
+        """Move the prefetch window around a canvas.
+
+        Work for canvases outside the new window is cancelled, including the
+        downloads in progress, and the resources of the neighbours not yet downloaded are scheduled,
+        nearest first. Resolving the URLs of the neighbours is also done in
+        background since it can require requests (e.g. for info.json).
+
+        Args:
+            index (int): The canvas shown.
+            count (int): The number of canvases of the manifest.
+        """
+        with self._lock:
+            self.current = index
+            for key, (future, i) in list(self._futures.items()):
+                if not self._wanted(i):
+                    future.cancel()
+                    del self._futures[key]
+            for i in list(self._cancels):
+                if not self._wanted(i):
+                    self._cancels.pop(i).set()
+            self._evict()
+        self._executor.submit(self._schedulewindow, index, count)
+
+    def _schedulewindow(self, index, count):
+        for distance in range(1, self.depth + 1):
+            for i in (index + distance, index - distance):
+                if self._closed.is_set():
+                    return
+                if 0 <= i < count and self.current == index:
+                    self._schedule(i)
+
+    def _schedule(self, index):
+        images, pages = self.resolve(index)
+        keys = [("image", url) for url in images] + [("json", url) for url in pages]
+        for key in keys:
+            with self._lock:
+                if key in self._items or key in self._futures:
+                    continue
+                if not self._wanted(index):
+                    return
+                cancel = self._cancels.setdefault(index, threading.Event())
+                future = self._executor.submit(self._load, *key, cancel)
+                self._futures[key] = (future, index)
+            future.add_done_callback(
+                lambda f, key=key, index=index: self._done(key, index, f)
+            )
+
+    def _get(self, key, cancel=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key][1]
+            pending = self._futures.get(key)
+        if pending is None:
+            return None
+        future = pending[0]
+        # the caller stops waiting when its own request is cancelled
+        while cancel is not None and not future.done():
+            if cancel.is_set():
+                return None
+            wait([future], timeout=0.05)
+        try:
+            return future.result()[0]
+        except (CancelledError, DownloadCancelled, OSError, ValueError):
+            return None
+
+    def has_image(self, url):
+        """True if the image of the URL is already prefetched."""
+        with self._lock:
+            return ("image", url) in self._items
+
+    def get_image(self, url, cancel=None):
+        """Return the prefetched image of the URL, waiting for it if it is
+        being downloaded, or None if it was not prefetched.
+
+        Args:
+            url (str): The URL of the image.
+            cancel (threading.Event, optional): Stop waiting and return None
+            when it is set. Defaults to None.
+        """
+        return self._get(("image", url), cancel)
+
+    def get_json(self, url, cancel=None):
+        """Return the prefetched JSON document (e.g. an AnnotationPage) or
+        None, see get_image."""
+        return self._get(("json", url), cancel)
+
+    def clear(self):
+        """Cancel every pending download and drop the prefetched resources."""
+        with self._lock:
+            for future, _ in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+            for cancel in self._cancels.values():
+                cancel.set()
+            self._cancels.clear()
+            self._items.clear()
+            self.total_bytes = 0
+
+    def close(self, wait=True):
+        """Cancel the downloads and stop the background threads.
+
+        Args:
+            wait (bool, optional): Wait for the threads to exit. Defaults to
+            True.
+        """
+        self._closed.set()
+        self.clear()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
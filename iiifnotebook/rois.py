@@ -0,0 +1,185 @@
+"""
+Extraction of the saved regions of interest (RoIs) of many canvases at once.
+RoIs of the same canvas that overlap heavily are downloaded with a single
+request of the region enclosing them and cropped locally.
+"""
+from concurrent.futures import as_completed
+import json
+import os
+
+import numpy as np
+
+from .geometry import format_region
+
+
+class RoIResult:
+    __slots__ = ("canvas", "index", "comment", "pct", "box", "image")
+
+    def __init__(self, canvas, index, comment, pct, box, image):
+        """The pixels of a RoI with its coordinates.
+
+        Args:
+            canvas (int): The canvas of the RoI.
+            index (int): The position of the RoI among the ones of the canvas.
+            comment (str): The comment saved with the RoI.
+            pct (list): x, y, width, height in percentage of the canvas.
+            box (tuple): x, y, width, height in pixels of the returned image
+            of the enclosing request, i.e. where the RoI was cropped.
+            image (numpy.ndarray): The pixels of the RoI.
+        """
+        self.canvas = canvas
+        self.index = index
+        self.comment = comment
+        self.pct = pct
+        self.box = box
+        self.image = image
+
+    def to_dict(self):
+        return {
+            "canvas": self.canvas,
+            "index": self.index,
+            "comment": self.comment,
+            "pct": list(self.pct),
+            "box": list(self.box),
+            "shape": list(self.image.shape),
+        }
+
+
+def _enclosing(a, b):
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1 = max(a[0] + a[2], b[0] + b[2])
+    y1 = max(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def _intersection(a, b):
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    return max(w, 0) * max(h, 0)
+
+
+def coalesce(boxes, threshold=0.7):
+    """Group boxes whose enclosing box would be mostly covered by them.
+
+    Two groups are merged when the area covered by both, divided by the
+    area of the box enclosing them, is at least the threshold: downloading
+    the enclosing box then wastes little compared with two requests.
+
+    Args:
+        boxes (list): Boxes (x, y, width, height).
+        threshold (float, optional): Between 0 and 1, 1 merges only boxes
+        contained in each other. Defaults to 0.7.
+
+    Returns:
+        list: Tuples (enclosing box, indices of the boxes of the group).
+    """
+    groups = [(tuple(box), [i], box[2] * box[3]) for i, box in enumerate(boxes)]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                (a, ia, area_a), (b, ib, area_b) = groups[i], groups[j]
+                enclosing = _enclosing(a, b)
+                covered = area_a + area_b - _intersection(a, b)
+                area = enclosing[2] * enclosing[3]
+                if area > 0 and covered / area >= threshold:
+                    groups[i] = (enclosing, ia + ib, min(covered, area))
+                    del groups[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [(box, members) for box, members, _ in groups]
+
+
+def _crop(img, enclosing, pct):
+    """Cut a RoI (percentages of the canvas) from the image of the enclosing
+    region (percentages of the canvas)."""
+    sx = img.shape[1] / enclosing[2] if enclosing[2] else 0
+    sy = img.shape[0] / enclosing[3] if enclosing[3] else 0
+    x = int(round((pct[0] - enclosing[0]) * sx))
+    y = int(round((pct[1] - enclosing[1]) * sy))
+    w = max(1, int(round(pct[2] * sx)))
+    h = max(1, int(round(pct[3] * sy)))
+    return img[y : y + h, x : x + w], (x, y, w, h)
+
+
+def iter_rois(
+    fetcher,
+    canvas_index,
+    rois,
+    size="max",
+    quality="default",
+    fmt="jpg",
+    choice=0,
+    threshold=0.7,
+    out_dir=None,
+):
+    """Download the RoIs of many canvases concurrently.
+
+    Args:
+        fetcher (Fetcher): Used for downloading.
+        canvas_index (CanvasIndex): The canvases of the manifest.
+        rois (dict): Canvas index -> list of (pct box, comment), as
+        IIIFviewer.RoIs.
+        size (str, optional): The size parameter of the (enclosing) requests.
+        Use "max" or "pct:n" for having all the RoIs at the same scale.
+        Defaults to "max".
+        quality (str, optional): Defaults to "default".
+        fmt (str, optional): Defaults to "jpg".
+        choice (int, optional): The layer of Choice canvases. Defaults to 0.
+        threshold (float, optional): See coalesce. Defaults to 0.7.
+        out_dir (str, optional): If given each RoI is saved as .npy in this
+        folder as soon as it is available, and described in rois.jsonl
+        (rewritten by every call). Defaults to None.
+
+    Yields:
+        RoIResult: The RoIs, in the order they are downloaded.
+    """
+    futures = {}
+    for canvas, canvasrois in rois.items():
+        record = canvas_index[canvas]
+        if not record.layers or not canvasrois:
+            continue
+        layer = record.layer(choice)
+        boxes = [roi[0] for roi in canvasrois]
+        if layer.service_id is None:
+            # no image service: the image is downloaded once and cropped
+            groups = [((0, 0, 100, 100), list(range(len(boxes))))]
+        else:
+            groups = coalesce(boxes, threshold)
+        for enclosing, members in groups:
+            if layer.service_id is None:
+                url = layer.image_id
+            else:
+                region = format_region(enclosing, pct=True, decimals=4)
+                url = canvas_index.image_url(
+                    canvas, region, size, 0, quality, fmt, choice=choice
+                )
+            future = fetcher.submit(fetcher.imread, url)
+            futures[future] = (canvas, enclosing, members)
+    index_file = None
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        index_file = open(os.path.join(out_dir, "rois.jsonl"), "w")
+    try:
+        for future in as_completed(futures):
+            canvas, enclosing, members = futures[future]
+            img = future.result()
+            for member in members:
+                pct, comment = rois[canvas][member]
+                crop, box = _crop(img, enclosing, pct)
+                result = RoIResult(canvas, member, comment, pct, box, crop.copy())
+                if index_file is not None:
+                    filename = f"canvas{canvas}_roi{member}.npy"
+                    np.save(os.path.join(out_dir, filename), result.image)
+                    index_file.write(json.dumps(dict(result.to_dict(), file=filename)))
+                    index_file.write("\n")
+                    index_file.flush()
+                yield result
+    finally:
+        for future in futures:
+            future.cancel()
+        if index_file is not None:
+            index_file.close()
@@ -0,0 +1,178 @@
+"""
+Spatial lookup of the annotations of a canvas. A uniform grid over the boxes
+of the targets answers "which annotations intersect this rectangle" without
+testing every annotation, which is used for drawing only what is in view and
+for selecting the annotations of a region in analysis code.
+"""
+import math
+
+import numpy as np
+
+from .geometry import regions_to_boxes
+from .utils import getTarget
+
+
+class GridIndex:
+    def __init__(self, boxes, side=None, max_cells=16):
+        """A uniform grid of side x side cells over a set of boxes.
+
+        The boxes are bucketed in every cell they touch and the buckets are
+        stored as a single sorted array with offsets, so a query only slices
+        the rows of cells it covers. Boxes touching more than max_cells cells
+        (e.g. whole canvas annotations) are kept apart and tested by every
+        query, so they do not fill the grid.
+
+        Args:
+            boxes (array_like): Boxes (x, y, width, height), shape (n, 4).
+            side (int, optional): Cells per side. Defaults to the square root
+            of the number of boxes (at most 256).
+            max_cells (int, optional): Cells a box can touch to be bucketed.
+            Defaults to 16.
+        """
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        n = len(self.boxes)
+        x0, y0 = self.boxes[:, 0], self.boxes[:, 1]
+        x1, y1 = x0 + self.boxes[:, 2], y0 + self.boxes[:, 3]
+        self._bounds = (x0, y0, x1, y1)
+        if side is None:
+            side = min(256, max(1, int(math.sqrt(n))))
+        self.side = side
+        if n == 0:
+            self.origin = (0.0, 0.0)
+            self.cell = (1.0, 1.0)
+            self._ids = np.empty(0, dtype=int)
+            self._large = np.empty(0, dtype=int)
+            self._start = np.zeros(side * side + 1, dtype=int)
+            return
+        self.origin = (x0.min(), y0.min())
+        self.cell = (
+            max(x1.max() - self.origin[0], 1e-9) / side,
+            max(y1.max() - self.origin[1], 1e-9) / side,
+        )
+        cx0, cy0 = self._cells(x0, y0)
+        cx1, cy1 = self._cells(x1, y1)
+        widths = cx1 - cx0 + 1
+        counts = widths * (cy1 - cy0 + 1)
+        large = counts > max_cells
+        self._large = np.flatnonzero(large)
+        counts[large] = 0
+        ids = np.repeat(np.arange(n), counts)
+        # position of each entry inside the block of cells of its box
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        widths = np.repeat(widths, counts)
+        cx = np.repeat(cx0, counts) + local % widths
+        cy = np.repeat(cy0, counts) + local // widths
+        cellids = cy * side + cx
+        order = np.argsort(cellids, kind="stable")
+        self._ids = ids[order]
+        self._start = np.searchsorted(cellids[order], np.arange(side * side + 1))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _cells(self, x, y):
+        cx = np.floor((np.asarray(x) - self.origin[0]) / self.cell[0]).astype(int)
+        cy = np.floor((np.asarray(y) - self.origin[1]) / self.cell[1]).astype(int)
+        return np.clip(cx, 0, self.side - 1), np.clip(cy, 0, self.side - 1)
+
+    def query(self, box):
+        """Return the indices of the boxes intersecting a box.
+
+        Args:
+            box (tuple): x, y, width, height.
+
+        Returns:
+            numpy.ndarray: The sorted indices.
+        """
+        qx0, qy0 = box[0], box[1]
+        qx1, qy1 = qx0 + box[2], qy0 + box[3]
+        if len(self.boxes) == 0:
+            return np.empty(0, dtype=int)
+        (cx0, cx1), (cy0, cy1) = self._cells([qx0, qx1], [qy0, qy1])
+        # the cells of a row are contiguous in the sorted buckets
+        rows = []
+        for cy in range(cy0, cy1 + 1):
+            first = self._start[cy * self.side + cx0]
+            last = self._start[cy * self.side + cx1 + 1]
+            rows.append(self._ids[first:last])
+        rows.append(self._large)
+        candidates = np.unique(np.concatenate(rows))
+        x0, y0, x1, y1 = (b[candidates] for b in self._bounds)
+        hit = (x0 <= qx1) & (x1 >= qx0) & (y0 <= qy1) & (y1 >= qy0)
+        return candidates[hit]
+
+
+def thin(boxes, indices, pixel_size, min_pixels=2, max_count=2000):
+    """Level of detail: choose which of the boxes in view are worth drawing.
+
+    Boxes smaller than min_pixels screen pixels are dropped (points, i.e.
+    empty boxes, are kept), then if more than max_count are left the largest
+    ones are kept.
+
+    Args:
+        boxes (numpy.ndarray): All the boxes, shape (n, 4).
+        indices (numpy.ndarray): The indices of the boxes in view.
+        pixel_size (float): Size of a screen pixel in the units of the boxes.
+        min_pixels (float, optional): Defaults to 2.
+        max_count (int, optional): Defaults to 2000.
+
+    Returns:
+        numpy.ndarray: The sorted indices to draw.
+    """
+    sizes = boxes[indices, 2:].max(axis=1)
+    keep = indices[(sizes == 0) | (sizes >= min_pixels * pixel_size)]
+    if len(keep) > max_count:
+        areas = boxes[keep, 2] * boxes[keep, 3]
+        keep = np.sort(keep[np.argpartition(-areas, max_count)[:max_count]])
+    return keep
+
+
+class AnnotationIndex:
+    def __init__(self, items, width, height):
+        """Index the targets of annotations on a canvas.
+
+        Args:
+            items (list): The annotations.
+            width (float): Width of the canvas.
+            height (float): Height of the canvas.
+        """
+        regions, regionitems = [], []
+        points, pointitems = [], []
+        for item in items:
+            target = getTarget(item)
+            if target is None:
+                continue
+            selectortype, fragments = target
+            if selectortype == "region":
+                if isinstance(fragments, str):
+                    regions.append(fragments)
+                elif len(fragments) > 1:
+                    regions.append(fragments[-1])
+                else:
+                    # whole canvas case
+                    regions.append("full")
+                regionitems.append(item)
+            elif selectortype == "PointSelector" and None not in fragments[:2]:
+                points.append(fragments[:2])
+                pointitems.append(item)
+        # the regions first, then the points as empty boxes
+        self.items = regionitems + pointitems
+        boxes = regions_to_boxes(regions, width, height)
+        pointboxes = np.zeros((len(points), 4))
+        pointboxes[:, :2] = np.array(points, dtype=float).reshape(-1, 2)
+        self.boxes = np.concatenate([boxes, pointboxes])
+        self.is_point = np.arange(len(self.boxes)) >= len(boxes)
+        self.grid = GridIndex(self.boxes)
+
+    def __len__(self):
+        return len(self.items)
+
+    def query(self, box):
+        """Return the indices of the annotations intersecting a box (x, y,
+        width, height in canvas pixels)."""
+        return self.grid.query(box)
+
+    def within(self, box):
+        """Return the annotations intersecting a box (x, y, width, height in
+        canvas pixels)."""
+        return [self.items[i] for i in self.query(box)]
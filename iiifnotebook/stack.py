@@ -0,0 +1,65 @@
+"""
+Reading of multi-band images (e.g. the layers of a multispectral Choice) into
+a single preallocated array, optionally memory mapped on disk.
+"""
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+
+def read_stack(fetcher, urls, filename=None):
+    """Download images and stack them along the last axis.
+
+    The first band is decoded for knowing the shape and dtype of the stack,
+    then the output is allocated once and each band is copied into its slice
+    as soon as it is decoded. At most fetcher.workers bands are downloaded at
+    the same time, so the peak memory is the stack plus a few bands.
+
+    Args:
+        fetcher (Fetcher): Used for downloading the bands concurrently.
+        urls (list): The URLs of the bands, all of the same size.
+        filename (str, optional): If given the stack is written to this .npy
+        file and returned memory mapped, so that it can exceed the memory.
+        Defaults to None.
+
+    Raises:
+        ValueError: If the bands have different sizes.
+
+    Returns:
+        numpy.ndarray: Array (height, width, channels) where the channels of
+        each band follow the ones of the previous band.
+    """
+    first = fetcher.imread(urls[0])
+    channels = first.shape[2] if first.ndim == 3 else 1
+    shape = first.shape[:2] + (channels * len(urls),)
+    expected = first.shape
+    if filename is None:
+        stack = np.empty(shape, dtype=first.dtype)
+    else:
+        stack = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=first.dtype, shape=shape
+        )
+
+    def put(band, img):
+        if img.shape[:2] != shape[:2] or img.size != shape[0] * shape[1] * channels:
+            raise ValueError(
+                f"Band {band} has shape {img.shape}, expected {expected}."
+            )
+        target = stack[:, :, band * channels : (band + 1) * channels]
+        np.copyto(target, img.reshape(target.shape), casting="same_kind")
+
+    put(0, first)
+    del first
+    pending = {}
+    for band, url in enumerate(urls[1:], 1):
+        pending[fetcher.submit(fetcher.imread, url)] = band
+        if len(pending) < fetcher.workers:
+            continue
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            put(pending.pop(future), future.result())
+    for future, band in pending.items():
+        put(band, future.result())
+    if filename is not None:
+        stack.flush()
+    return stack
@@ -0,0 +1,60 @@
+"""
+Small helpers for reading IIIF JSON shared by the viewer and the headless
+code.
+"""
+
+def tryLanguage(iiifobject, preferred_language="en", verbose=True):
+    """Return the text of a language map in the preferred language.
+
+    Args:
+        iiifobject (dict): A language map, e.g. {"en": ["Title"]}.
+        preferred_language (str, optional): Defaults to 'en'.
+        verbose (bool, optional): Print a message when the preferred language
+        is not available. Defaults to True.
+
+    Returns:
+        str: The values joined with spaces. If the preferred language is
+        missing the "none" values are used, otherwise the first language.
+    """
+    if preferred_language in iiifobject:
+        values = iiifobject[preferred_language]
+    elif "none" in iiifobject:
+        values = iiifobject["none"]
+    else:
+        values = list(iiifobject.values())[0]
+        if verbose:
+            print(f"language {preferred_language} not available.")
+    return " ".join(values)
+
+
+def getTarget(iiifObjectWithTarget):
+    """Return the kind of selection of the target of an annotation.
+
+    Args:
+        iiifObjectWithTarget (dict): An annotation.
+
+    Raises:
+        ValueError: If the selector is not supported.
+
+    Returns:
+        tuple: ("region", the target split at "#xywh=" or the region of an
+        ImageApiSelector) or ("PointSelector", (x, y, t)). None if the target
+        is not understood.
+    """
+    target = iiifObjectWithTarget["target"]
+    if isinstance(target, str):
+        return ("region", target.split("#xywh="))
+    elif isinstance(target, dict):
+        if "source" in target and "selector" not in target:
+            return ("region", target["source"].split("#xywh="))
+        if "source" in target and "selector" in target:
+            if target["selector"]["type"] == "PointSelector":
+                x = target["selector"].get("x")
+                y = target["selector"].get("y")
+                t = target["selector"].get("t")
+                return ("PointSelector", (x, y, t))
+            if target["selector"]["type"] == "ImageApiSelector":
+                if "region" in target["selector"]:
+                    return ("region", target["selector"]["region"])
+            else:
+                raise ValueError(f"{target['selector']['type']} not supported")
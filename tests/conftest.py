@@ -0,0 +1,67 @@
+"""
+The tests run against the local IIIF stand-in server of the benchmarks, with
+small images served as png so that the pixels are exact.
+"""
+
+import io
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import iiifserver  # noqa: E402
+from iiifnotebook.fetcher import Fetcher  # noqa: E402
+
+WIDTH, HEIGHT = 360, 240
+
+
+@pytest.fixture(scope="session")
+def server():
+    srv, base = iiifserver.serve(
+        width=WIDTH,
+        height=HEIGHT,
+        canvases=3,
+        annotations=10,
+        collection_size=10,
+        image_pages=True,
+    )
+    yield base
+    srv.shutdown()
+
+
+@pytest.fixture
+def requests_count():
+    """Return the number of requests received since the test started."""
+    start = iiifserver.Handler.stats["requests"]
+    return lambda: iiifserver.Handler.stats["requests"] - start
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = Fetcher(workers=4)
+    yield fetcher
+    fetcher.close()
+
+
+@pytest.fixture(scope="session")
+def image_size():
+    """Width and height of the images of the server."""
+    return WIDTH, HEIGHT
+
+
+@pytest.fixture(scope="session")
+def full_image():
+    """Return a function decoding the image the server sends for a region and
+    size."""
+
+    def decode(region="full", size="max"):
+        data = iiifserver.render(region, size, "png", WIDTH, HEIGHT)
+        return np.asarray(Image.open(io.BytesIO(data)))
+
+    return decode
@@ -0,0 +1,47 @@
+import os
+
+from iiifnotebook.cache import DiskCache
+from iiifnotebook.fetcher import Fetcher
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=30)
+    for name in "abc":
+        cache.put(name, b"x" * 10)
+    cache.get("a")
+    cache.put("d", b"x" * 10)
+    assert "a" in cache and "b" not in cache
+    assert cache.total_bytes == 30
+
+
+def test_access_times_survive_reopening(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=30)
+    for name in "abc":
+        cache.put(name, b"x" * 10)
+    cache.get("a")
+    cache.flush()
+    cache = DiskCache(str(tmp_path), max_bytes=30)
+    cache.put("d", b"x" * 10)
+    assert "a" in cache and "b" not in cache
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put("a", b"data")
+    entry = cache.lookup("a")
+    os.remove(entry.path)
+    assert entry.read() is None
+    assert cache.get("a") is None
+
+
+def test_fetcher_reads_from_the_cache(server, tmp_path, requests_count):
+    url = f"{server}/img/c0/full/90,/0/default.png"
+    fetcher = Fetcher(cache=DiskCache(str(tmp_path)))
+    first = fetcher.imread(url)
+    second = fetcher.imread(url)
+    assert requests_count() == 1
+    os.remove(fetcher.cache.lookup(url).path)
+    third = fetcher.imread(url)
+    assert requests_count() == 2
+    assert (first == second).all() and (first == third).all()
+    fetcher.close()
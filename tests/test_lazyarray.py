@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+import pytest
+
+from iiifnotebook.lazyarray import IIIFArray
+
+
+@pytest.fixture
+def array(server, fetcher, image_size):
+    return IIIFArray(fetcher, f"{server}/img/c0", *image_size, chunk=64, fmt="png")
+
+
+def test_shape(array, image_size):
+    width, height = image_size
+    assert array.shape == (height, width, 3)
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        np.s_[10:100, 20:200],
+        np.s_[:, :],
+        np.s_[::2, ::2],
+        np.s_[::2, ::3],
+        np.s_[::3, ::2],
+        np.s_[::4, ::6],
+        np.s_[5:200:3, 7:300:2],
+        np.s_[::-2, ::3],
+        np.s_[50, ::3],
+        np.s_[::2, 71],
+    ],
+)
+def test_slicing_matches_numpy(array, key, full_image):
+    np.testing.assert_array_equal(array[key], full_image()[key])
+
+
+def test_read_larger_than_cache(
+    server, fetcher, requests_count, image_size, full_image
+):
+    array = IIIFArray(fetcher, f"{server}/img/c0", *image_size, chunk=16, fmt="png")
+    array.chunks.max_chunks = 8
+    array.shape
+    start = requests_count()
+    data = array[:, :]
+    # every chunk downloaded once
+    width, height = image_size
+    assert requests_count() - start == math.ceil(width / 16) * math.ceil(height / 16)
+    np.testing.assert_array_equal(data, full_image())
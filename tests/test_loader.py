@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import pytest
+
+from iiifnotebook.annopages import AnnotationPageLoader
+from iiifnotebook.fetcher import DownloadCancelled, Fetcher
+from iiifnotebook.imageservice import ImageInfo, fetch_region_tiles
+from iiifnotebook.loader import LatestLoader
+
+
+def test_nested_downloads_do_not_deadlock(server):
+    # more requests downloading tiles than workers of the fetcher
+    fetcher = Fetcher(workers=2)
+    service = f"{server}/img/c0"
+    info = ImageInfo.from_service(fetcher, service)
+
+    def fetch(cancel):
+        img, _ = fetch_region_tiles(
+            fetcher, info, service, 0, 0, 360, 240, 360, fmt="png", cancel=cancel
+        )
+        return img
+
+    async def load():
+        loop = asyncio.get_running_loop()
+        results = [loop.create_future() for _ in range(3)]
+        loaders = [LatestLoader(fetcher) for _ in results]
+        for loader, result in zip(loaders, results):
+            loader.request(fetch, result.set_result)
+        images = await asyncio.wait_for(asyncio.gather(*results), 10)
+        for loader in loaders:
+            loader.close()
+        return images
+
+    images = asyncio.run(load())
+    assert all(img.shape == (240, 360, 3) for img in images)
+    fetcher.close()
+
+
+def test_cancelled_tiles_are_not_downloaded(server, fetcher, requests_count):
+    cancel = threading.Event()
+    cancel.set()
+    urls = [f"{server}/img/c0/full/{w},/0/default.png" for w in (10, 20, 30)]
+    with pytest.raises(DownloadCancelled):
+        fetcher.imread_many(urls, cancel)
+    assert requests_count() == 0
+
+
+def test_cancelled_pages_are_not_downloaded(server, fetcher, requests_count):
+    cancel = threading.Event()
+    cancel.set()
+    pages = AnnotationPageLoader(fetcher)
+    assert list(pages.iter_pages([f"{server}/external/0/0"], cancel)) == []
+    assert requests_count() == 0
+    assert len(list(pages.iter_pages([f"{server}/external/0/0"]))) == 3
+    pages.close()
@@ -0,0 +1,18 @@
+from iiifnotebook import IIIFcore
+
+
+def test_pack_is_read_offline(server, tmp_path, requests_count):
+    path = str(tmp_path / "pack.zip")
+    core = IIIFcore(f"{server}/manifest.json")
+    pack = core.export_pack(path, sizes=("90,",), fmt="png")
+    pages = [f"{server}/external/{c}/{n}" for c in range(3) for n in range(3)]
+    assert all(url in pack for url in pages)
+    image = core.get_image(0, size="90,", fmt="png")
+    core.close()
+    pack.close()
+    start = requests_count()
+    offline = IIIFcore(None, pack=path)
+    assert (offline.get_image(0, size="90,", fmt="png") == image).all()
+    assert len(offline.annotationpages.items(pages[:1])) == 300
+    assert requests_count() == start
+    offline.close()
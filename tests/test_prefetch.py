@@ -0,0 +1,79 @@
+import threading
+import time
+
+import iiifserver
+import pytest
+
+from iiifnotebook import IIIFcore
+from iiifnotebook.prefetch import Prefetcher
+
+
+def prefetch_threads():
+    return [
+        t for t in threading.enumerate() if t.name.startswith("iiifnotebook-prefetch")
+    ]
+
+
+@pytest.fixture
+def core(server):
+    core = IIIFcore(f"{server}/manifest.json")
+    yield core
+    core.close()
+
+
+def image_url(core, index):
+    return core.get_imageURL(index, size="90,", fmt="png")
+
+
+def prefetcher(core):
+    def resolve(index):
+        return [image_url(core, index)], []
+
+    core.prefetcher = Prefetcher(core.fetcher, resolve, depth=1)
+    return core.prefetcher
+
+
+def test_close_stops_the_prefetcher(core):
+    prefetch = prefetcher(core)
+    prefetch.update(0, len(core))
+    url = image_url(core, 1)
+    deadline = time.monotonic() + 5
+    while not prefetch.has_image(url) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert prefetch.get_image(url) is not None
+    core.close()
+    assert not prefetch_threads()
+
+
+def test_waiting_stops_with_the_cancel_of_the_caller(core, monkeypatch):
+    monkeypatch.setattr(iiifserver.Handler.config, "latency", 1.0)
+    prefetch = prefetcher(core)
+    prefetch.update(0, len(core))
+    time.sleep(0.1)
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    start = time.monotonic()
+    assert prefetch.get_image(image_url(core, 1), cancel) is None
+    assert time.monotonic() - start < 0.5
+
+
+def test_canvases_leaving_the_window_are_cancelled(server, fetcher, monkeypatch):
+    monkeypatch.setattr(iiifserver.Handler.config, "latency", 1.0)
+
+    def url(index):
+        return f"{server}/img/c{index}/full/90,/0/default.png"
+
+    prefetch = Prefetcher(fetcher, lambda index: ([url(index)], []), depth=1)
+    prefetch.update(0, 100)
+    time.sleep(0.2)
+    prefetch.update(50, 100)
+    # the download of canvas 1 is no longer waited for nor kept
+    start = time.monotonic()
+    assert prefetch.get_image(url(1)) is None
+    assert time.monotonic() - start < 0.5
+    deadline = time.monotonic() + 5
+    while not prefetch.has_image(url(51)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert prefetch.has_image(url(51))
+    assert not prefetch.has_image(url(1))
+    prefetch.close()
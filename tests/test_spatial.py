@@ -0,0 +1,55 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from iiifnotebook.spatial import AnnotationIndex, GridIndex
+
+
+def brute_force(boxes, box):
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    qx0, qy0, qx1, qy1 = box[0], box[1], box[0] + box[2], box[1] + box[3]
+    return np.flatnonzero((x0 <= qx1) & (x1 >= qx0) & (y0 <= qy1) & (y1 >= qy0))
+
+
+@pytest.fixture
+def boxes():
+    rng = np.random.default_rng(0)
+    small = np.column_stack(
+        [rng.uniform(0, 4000, (2000, 2)), rng.uniform(0, 200, (2000, 2))]
+    )
+    whole = np.tile([0, 0, 4000, 3000], (50, 1))
+    return np.concatenate([small, whole])
+
+
+def test_query_matches_brute_force(boxes):
+    grid = GridIndex(boxes)
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        box = (*rng.uniform(-100, 4000, 2), *rng.uniform(0, 1500, 2))
+        np.testing.assert_array_equal(grid.query(box), brute_force(boxes, box))
+
+
+def test_whole_canvas_boxes(boxes):
+    # 5000 of them used to fill side x side cells each (1.7 GB)
+    whole = np.tile([0.0, 0.0, 4000.0, 3000.0], (5000, 1))
+    everything = np.concatenate([boxes, whole])
+    tracemalloc.start()
+    grid = GridIndex(everything)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 10 * 2**20
+    for box in [(10, 10, 1, 1), (3000, 2000, 500, 500), (5000, 5000, 10, 10)]:
+        np.testing.assert_array_equal(grid.query(box), brute_force(everything, box))
+    assert len(grid.query((10, 10, 1, 1))) >= 5000
+
+
+def test_annotations_of_the_server(server, fetcher):
+    manifest = fetcher.get_json(f"{server}/manifest.json")
+    canvas = manifest["items"][0]
+    items = canvas["annotations"][0]["items"]
+    index = AnnotationIndex(items, canvas["width"], canvas["height"])
+    assert len(index) == 10
+    found = index.within((0, 0, 100, 100))
+    assert [item["id"].rsplit("/", 1)[1] for item in found] == ["0", "1"]
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from iiifnotebook.stack import read_stack
+
+
+def url(base, ident, size="60,"):
+    return f"{base}/img/{ident}/full/{size}/0/default.png"
+
+
+def test_bands_stacked_in_order(server, fetcher, full_image):
+    sizes = ["60,", "60,", "60,"]
+    stack = read_stack(fetcher, [url(server, f"b{k}", s) for k, s in enumerate(sizes)])
+    band = full_image(size="60,")
+    assert stack.shape == band.shape[:2] + (9,)
+    for k in range(3):
+        np.testing.assert_array_equal(stack[:, :, 3 * k : 3 * k + 3], band)
+
+
+def test_memory_mapped(server, fetcher, tmp_path):
+    filename = str(tmp_path / "stack.npy")
+    stack = read_stack(fetcher, [url(server, "b0"), url(server, "b1")], filename)
+    np.testing.assert_array_equal(np.load(filename), stack)
+
+
+def test_mismatched_band(server, fetcher):
+    with pytest.raises(ValueError, match="Band 1"):
+        read_stack(fetcher, [url(server, "b0"), url(server, "b1", "30,")])
@@ -0,0 +1,65 @@
+import matplotlib
+import pytest
+
+matplotlib.use("Agg")
+
+from iiifnotebook import IIIFviewer  # noqa: E402
+
+
+@pytest.fixture
+def viewer(server):
+    viewer = IIIFviewer(f"{server}/manifest.json")
+    yield viewer
+    viewer.close()
+
+
+@pytest.mark.parametrize("preview", [False, True])
+def test_stack_with_auto_size(viewer, preview):
+    viewer.W_preview_size.value = "auto"
+    viewer.W_final_size.value = "auto"
+    stack, labels = viewer.get_stack(1, preview=preview)
+    assert labels == ["band 0", "band 1", "band 2", "band 3"]
+    assert stack.ndim == 3 and stack.shape[2] == 12
+    assert viewer.get_stackfromChoices(1).shape == stack.shape
+
+
+def test_referenced_pages_of_the_image_are_loaded(viewer):
+    # 10 embedded annotations and 3 referenced pages of 100 on the canvas,
+    # the same 3 pages referenced by the image
+    ids = [item["id"] for item in viewer.annotations.items]
+    assert len(ids) == 610
+    assert sum("/ext/0/" in i for i in ids) == 600
+
+
+def test_bytes_are_counted_per_canvas(server):
+    viewer = IIIFviewer(f"{server}/manifest.json", profile=True)
+    viewer.W_canvasID.value = 2
+    canvases = [e for e in viewer.profiler.events if e["name"] == "canvas"]
+    fetched = [e for e in viewer.profiler.events if e["name"] == "fetch"]
+    assert [e["canvas"] for e in canvases] == [0, 2]
+    for event in canvases:
+        assert event["bytes"] > 0
+        assert event["bytes"] == sum(
+            e["bytes"] for e in fetched if e.get("canvas") == event["canvas"]
+        )
+    assert "MiB downloaded" in viewer._stats_html.value
+    viewer.close()
+
+
+def test_running_in_jupyter_is_still_importable():
+    from iiifnotebook.main import RUNNING_IN_JUPYTER, running_in_jupyter
+
+    assert RUNNING_IN_JUPYTER is running_in_jupyter()
+
+
+@pytest.mark.parametrize("offset", [0, 1000])
+def test_tiles_of_the_view(viewer, offset, caplog):
+    viewer.W_deepzoom.value = True
+    viewer.ax.set_xlim(offset + 99.5, offset + 199.5)
+    viewer.ax.set_ylim(149.5, 49.5)
+    viewer.W_loadZoombtn.click()
+    tiles = [layer for layer in viewer.layers.layers if layer.kind == "tile"]
+    # nothing to load when the view is outside the image
+    assert len(tiles) == (0 if offset else 1)
+    # ipywidgets logs the exceptions of the click handlers
+    assert not [r for r in caplog.records if "Exception in callback" in r.message]